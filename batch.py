@@ -0,0 +1,187 @@
+import argparse
+import csv
+import functools
+import itertools
+import json
+import os
+import sys
+
+from heredity import (
+    ENGINES, PROBS, ResultCache, infer_families, load_probs,
+    people_from_rows
+)
+
+# Columns written in CSV output, one row per person
+CSV_FIELDS = [
+    "family", "person",
+    "gene_2", "gene_1", "gene_0",
+    "trait_true", "trait_false"
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        usage="python batch.py [options] PATH [PATH ...]",
+        description="Run inference on many families in one process. "
+                    "Each PATH is a CSV file, a directory of CSV files, "
+                    "or a CSV file with a family_id column holding many "
+                    "families."
+    )
+    parser.add_argument("paths", nargs="+", metavar="PATH")
+    parser.add_argument("--engine", choices=ENGINES, default="exact",
+                        help="inference engine to use (default: exact)")
+    parser.add_argument("--probs", metavar="FILE",
+                        help="JSON or YAML file of probabilities to use "
+                             "in place of PROBS")
+    parser.add_argument("--format", choices=("jsonl", "csv"),
+                        default="jsonl",
+                        help="output format (default: jsonl)")
+    parser.add_argument("--output", metavar="FILE",
+                        help="file to write results to (default: stdout)")
+    parser.add_argument("--cache", metavar="FILE",
+                        help="SQLite file to look each family's results up "
+                             "in, and to store new results in")
+    parser.add_argument("--cache-size", type=float, default=256,
+                        metavar="MiB",
+                        help="space for cached results before the least "
+                             "recently used are deleted (default: 256)")
+    args = parser.parse_args()
+    if args.cache and args.engine == "gibbs":
+        parser.error("--cache cannot be used with --engine gibbs")
+    try:
+        probs = load_probs(args.probs) if args.probs else PROBS
+    except (ImportError, OSError, ValueError) as e:
+        sys.exit(str(e))
+    engine = functools.partial(ENGINES[args.engine], probs=probs)
+    cache = None
+    if args.cache:
+        cache = ResultCache(args.cache, probs,
+                            max_bytes=int(args.cache_size * 2**20))
+
+    output = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        if args.format == "jsonl":
+            write, write_error = jsonl_writer(output)
+        else:
+            write, write_error = csv_writer(output)
+        failed = 0
+        for filename in find_csvs(args.paths):
+            # A bad family is reported and skipped, and a file that can't
+            # be read at all is reported and the next one tried
+            try:
+                for family, people in read_families([filename]):
+                    try:
+                        probabilities = infer_families(people, engine,
+                                                       cache=cache)
+                    except ValueError as e:
+                        write_error(family, e)
+                        failed += 1
+                    else:
+                        write(family, probabilities)
+                    output.flush()
+            except (OSError, ValueError) as e:
+                print(e, file=sys.stderr)
+                failed += 1
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if cache is not None:
+            cache.close()
+    if failed:
+        sys.exit(f"{failed} families or files could not be processed")
+
+
+def find_csvs(paths):
+    """
+    Lazily generate CSV file paths from `paths`, expanding directories
+    into the CSV files directly inside them, in name order.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(".csv"):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+def read_families(filenames):
+    """
+    Lazily generate (family, people) pairs from the CSV files in
+    `filenames`, holding only one family in memory at a time.
+
+    A file with a family_id column may hold many families, whose rows
+    must be contiguous; each is named by its family_id. Any other file
+    is a single family named after the file.
+    """
+    for filename in filenames:
+        with open(filename, newline="") as f:
+            reader = csv.DictReader(f)
+            fields = reader.fieldnames or []
+            for field in ("name", "mother", "father", "trait"):
+                if field not in fields:
+                    raise ValueError(f"{filename} has no {field} column")
+            if "family_id" not in fields:
+                name = os.path.splitext(os.path.basename(filename))[0]
+                yield name, people_from_rows(reader)
+                continue
+
+            seen = set()
+            for family, rows in itertools.groupby(
+                reader, key=lambda row: row["family_id"]
+            ):
+                if family in seen:
+                    raise ValueError(
+                        f"{filename}: rows for family {family!r} "
+                        "are not contiguous"
+                    )
+                seen.add(family)
+                yield family, people_from_rows(rows)
+
+
+def jsonl_writer(output):
+    """
+    Return functions that write a family's `probabilities` to `output`
+    as JSON lines, one object per person, and that write an error for a
+    family as one object with an error field.
+    """
+    def write(family, probabilities):
+        for person in probabilities:
+            output.write(json.dumps({
+                "family": family,
+                "person": person,
+                **probabilities[person]
+            }) + "\n")
+
+    def write_error(family, error):
+        output.write(json.dumps({"family": family, "error": str(error)}) +
+                     "\n")
+    return write, write_error
+
+
+def csv_writer(output):
+    """
+    Return functions that write a family's `probabilities` to `output`
+    as CSV rows, one per person, after a header row, and that report an
+    error for a family on stderr.
+    """
+    writer = csv.writer(output)
+    writer.writerow(CSV_FIELDS)
+
+    def write(family, probabilities):
+        for person in probabilities:
+            gene = probabilities[person]["gene"]
+            trait = probabilities[person]["trait"]
+            writer.writerow([
+                family, person,
+                gene[2], gene[1], gene[0],
+                trait[True], trait[False]
+            ])
+
+    def write_error(family, error):
+        print(f"{family}: {error}", file=sys.stderr)
+    return write, write_error
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+"""
+Benchmarks for heredity: a synthetic pedigree generator and a harness
+that times loading and inference and compares runs against a baseline.
+
+Run from the repository root with `python -m benchmarks.run`.
+"""
@@ -0,0 +1,140 @@
+import argparse
+import csv
+import random
+
+from heredity import GENES, compile_model
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        usage="python -m benchmarks.generate [options] output.csv",
+        description="Write a synthetic pedigree to a CSV file."
+    )
+    parser.add_argument("output")
+    parser.add_argument("--founders", type=int, default=4)
+    parser.add_argument("--generations", type=int, default=3)
+    parser.add_argument("--children", type=int, default=2,
+                        help="children per couple")
+    parser.add_argument("--observed", type=float, default=0.5,
+                        help="fraction of people with a known trait")
+    parser.add_argument("--loops", type=int, default=0,
+                        help="couples per generation formed between "
+                             "relatives rather than with newcomers")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    people = generate_pedigree(
+        founders=args.founders, generations=args.generations,
+        children=args.children, observed=args.observed, loops=args.loops,
+        seed=args.seed
+    )
+    write_csv(people, args.output)
+
+
+def generate_pedigree(founders=4, generations=3, children=2, observed=0.5,
+                      loops=0, seed=None, probs=None):
+    """
+    Return a synthetic pedigree, as a dictionary in the form of
+    `load_data`, descended from `founders` unrelated people over
+    `generations` generations, with `children` children per couple.
+
+    The founders pair up with each other (an odd one out with a
+    newcomer), and each founder couple's descendants make up a separate
+    family. In every later generation but the last, up to `loops`
+    couples are formed between relatives who share an ancestor, cousins
+    if there are any and siblings otherwise, closing inbreeding loops.
+    Everyone else pairs with a newcomer without parents, who joins their
+    family, and the last generation has no partners. Genes and traits are drawn from `probs` (PROBS by default), and each
+    person's trait is recorded with probability `observed`.
+    """
+    rng = random.Random(seed)
+    model = compile_model(probs)
+    people = dict()
+    genes = dict()
+    ancestors = dict()
+
+    def draw(distribution):
+        return rng.choices(GENES, weights=distribution)[0]
+
+    def add(mother=None, father=None):
+        name = f"P{len(people)}"
+        if mother is None:
+            genes[name] = draw(model.prior)
+        else:
+            genes[name] = draw([
+                model.inheritance[count][genes[mother]][genes[father]]
+                for count in GENES
+            ])
+        ancestors[name] = set() if mother is None else (
+            {mother, father} | ancestors[mother] | ancestors[father]
+        )
+        trait = None
+        if rng.random() < observed:
+            trait = rng.random() < model.trait[genes[name]][1]
+        people[name] = {
+            "name": name, "mother": mother, "father": father, "trait": trait
+        }
+        return name
+
+    generation = [add() for _ in range(founders)]
+    couples = list(zip(generation[::2], generation[1::2]))
+    if founders % 2:
+        couples.append((generation[-1], add()))
+    for remaining in reversed(range(generations)):
+        generation = [
+            add(mother, father)
+            for mother, father in couples
+            for _ in range(children)
+        ]
+        rng.shuffle(generation)
+        if not remaining:
+            break
+
+        # Pair up relatives first, cousins before siblings, then give
+        # everyone left a newcomer as a partner
+        couples = []
+        single = list(generation)
+        for first in generation:
+            if len(couples) == loops:
+                break
+            if first not in single:
+                continue
+            parents = {people[first]["mother"], people[first]["father"]}
+            relatives = [
+                other for other in single
+                if other != first and ancestors[other] & ancestors[first]
+            ]
+            cousins = [
+                other for other in relatives
+                if not parents & {people[other]["mother"],
+                                  people[other]["father"]}
+            ]
+            if relatives:
+                partner = (cousins or relatives)[0]
+                single.remove(first)
+                single.remove(partner)
+                couples.append((first, partner))
+        couples.extend((person, add()) for person in single)
+
+    return people
+
+
+def write_csv(people, filename):
+    """
+    Write `people` to `filename` as a CSV file that `load_data` reads.
+    """
+    with open(filename, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["name", "mother", "father", "trait"])
+        for person in people.values():
+            trait = person["trait"]
+            writer.writerow([
+                person["name"],
+                person["mother"] or "",
+                person["father"] or "",
+                "" if trait is None else int(trait)
+            ])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import heredity
+from benchmarks.generate import generate_pedigree, write_csv
+
+# Synthetic pedigrees to benchmark, and the engines to run on each.
+# Brute-force engines only run on pedigrees small enough to enumerate.
+SCENARIOS = {
+    "tiny": {
+        "pedigree": {"founders": 2, "generations": 1, "children": 2},
+        "engines": ["exact", "enumerate", "pruned", "gray", "vectorized"]
+    },
+    "small": {
+        "pedigree": {"founders": 2, "generations": 1, "children": 3,
+                     "observed": 0.6},
+        "engines": ["exact", "enumerate", "pruned", "gray", "vectorized"]
+    },
+    "medium": {
+        "pedigree": {"founders": 8, "generations": 4, "children": 3,
+                     "loops": 1},
+        "engines": ["exact", "gibbs"]
+    },
+    "large": {
+        "pedigree": {"founders": 16, "generations": 6, "children": 2,
+                     "loops": 2},
+        "engines": ["exact"]
+    }
+}
+
+# Scenarios run with --quick
+QUICK = ["tiny", "medium"]
+
+# Calls made when timing joint_probability and update on their own
+CALLS = 500
+
+# Where baselines are kept unless told otherwise
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        usage="python -m benchmarks.run [options]",
+        description="Time heredity on synthetic pedigrees and compare "
+                    "the results with a saved baseline."
+    )
+    parser.add_argument("--baseline", default=BASELINE, metavar="FILE",
+                        help="baseline file to compare with or save to")
+    parser.add_argument("--save", action="store_true",
+                        help="save these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="fractional slowdown that counts as a "
+                             "regression (default: 0.25)")
+    parser.add_argument("--noise", type=float, default=0.001,
+                        metavar="SECONDS",
+                        help="slowdowns smaller than this are never "
+                             "regressions (default: 0.001)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs per measurement, keeping the fastest")
+    parser.add_argument("--quick", action="store_true",
+                        help=f"only run {', '.join(QUICK)}")
+    parser.add_argument("--scenario", action="append",
+                        choices=SCENARIOS, help="scenario to run "
+                        "(may be repeated; default: all)")
+    parser.add_argument("--output", metavar="FILE",
+                        help="also write these results to FILE")
+    args = parser.parse_args()
+
+    names = args.scenario or (QUICK if args.quick else list(SCENARIOS))
+    results = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "benchmarks": dict()
+    }
+    for name in names:
+        for key, measurement in run_scenario(name, args.repeat).items():
+            results["benchmarks"][key] = measurement
+            print(format_measurement(key, measurement))
+
+    if args.output:
+        write_results(results, args.output)
+
+    if args.save:
+        write_results(results, args.baseline)
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold,
+                              args.noise)
+        for message in regressions:
+            print(f"REGRESSION: {message}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
+
+
+def run_scenario(name, repeat):
+    """
+    Run every benchmark for scenario `name`, returning a dictionary of
+    measurements keyed by "scenario/benchmark".
+    """
+    scenario = SCENARIOS[name]
+    people = generate_pedigree(seed=0, **scenario["pedigree"])
+    results = dict()
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, f"{name}.csv")
+        write_csv(people, filename)
+        results["load_data"] = measure(
+            lambda: heredity.load_data(filename), repeat
+        )
+        results["load_pedigree"] = measure(
+            lambda: heredity.load_pedigree(filename), repeat
+        )
+
+    # Time the original per-assignment functions on random assignments
+    rng = random.Random(0)
+    assignments = []
+    for _ in range(CALLS):
+        one_gene, two_genes, have_trait = set(), set(), set()
+        for person in people:
+            genes = rng.choice(heredity.GENES)
+            if genes == 1:
+                one_gene.add(person)
+            elif genes == 2:
+                two_genes.add(person)
+            if rng.random() < 0.5:
+                have_trait.add(person)
+        assignments.append((one_gene, two_genes, have_trait))
+
+    def joint_probabilities():
+        for one_gene, two_genes, have_trait in assignments:
+            heredity.joint_probability(people, one_gene, two_genes,
+                                       have_trait)
+
+    def updates():
+        probabilities = heredity.empty_probabilities(people)
+        for one_gene, two_genes, have_trait in assignments:
+            heredity.update(probabilities, one_gene, two_genes, have_trait,
+                            0.5)
+        heredity.normalize(probabilities)
+
+    results["joint_probability"] = measure(
+        joint_probabilities, repeat, count=CALLS
+    )
+    results["update_normalize"] = measure(updates, repeat, count=CALLS)
+
+    # Time full inference, counting assignments for brute-force engines
+    unknown = sum(1 for person in people.values() if person["trait"] is None)
+    assignments = 3 ** len(people) * 2 ** unknown
+    for engine in scenario["engines"]:
+        run = heredity.ENGINES[engine]
+        if engine == "gibbs":
+            def run(people):
+                return heredity.gibbs_sample(people, samples=2560,
+                                             chains=128, burn_in=20, seed=0)
+        if engine in ("enumerate", "gray", "vectorized"):
+            count = assignments
+        elif engine == "pruned":
+            count = 3 ** len(people)
+        else:
+            count = None
+        results[f"infer[{engine}]"] = measure(
+            lambda: run(people), repeat, count=count
+        )
+
+    return {
+        f"{name}/{benchmark}": dict(measurement, people=len(people))
+        for benchmark, measurement in results.items()
+    }
+
+
+def measure(function, repeat, count=None):
+    """
+    Call `function` `repeat` times and return the fastest wall time in
+    seconds, and peak memory from one further traced call. If `count`
+    is given, also return how many of it were done per second.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    # Tracing slows everything down, so it is kept out of the timings
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    measurement = {"seconds": min(times), "peak_bytes": peak}
+    if count is not None:
+        measurement["per_second"] = count / min(times)
+    return measurement
+
+
+def format_measurement(key, measurement):
+    """
+    Return a line of text describing one measurement.
+    """
+    line = (f"{key:40} {measurement['seconds'] * 1000:10.2f} ms "
+            f"{measurement['peak_bytes'] / 1024:10.1f} KiB")
+    if "per_second" in measurement:
+        line += f" {measurement['per_second']:14,.0f} /s"
+    return line
+
+
+def compare(results, baseline, threshold, noise=0):
+    """
+    Return a message for every benchmark in `results` that is slower
+    than in `baseline` by more than the fraction `threshold` and by more
+    than `noise` seconds.
+    """
+    regressions = []
+    for key, measurement in results["benchmarks"].items():
+        before = baseline["benchmarks"].get(key)
+        if before is None:
+            continue
+        ratio = measurement["seconds"] / before["seconds"]
+        slowdown = measurement["seconds"] - before["seconds"]
+        if ratio > 1 + threshold and slowdown > noise:
+            regressions.append(
+                f"{key} took {measurement['seconds'] * 1000:.2f} ms, "
+                f"{ratio:.2f}x the baseline's "
+                f"{before['seconds'] * 1000:.2f} ms"
+            )
+    return regressions
+
+
+def write_results(results, filename):
+    """
+    Write `results` to `filename` as JSON.
+    """
+    with open(filename, "w") as f:
+        json.dump(results, f, indent=4)
+        f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,42 @@
+import argparse
+import collections
+import contextlib
+import cProfile
 import csv
+import functools
+import hashlib
+import heapq
+import io
 import itertools
+import json
+import math
+import mmap
+import operator
+import os
+import pstats
+import sqlite3
+import struct
 import sys
+import time
+import tracemalloc
+import zipfile
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
 
 PROBS = {
 
@@ -36,16 +72,214 @@ PROBS = {
     "mutation": 0.01
 }
 
+# Possible number of copies of the gene a person can have
+GENES = (0, 1, 2)
+
+# Joint probabilities are added up relative to a running log scale, which
+# only moves when one exceeds it by this much, so that totals neither
+# underflow on large pedigrees nor need rescaling often
+LOG_HEADROOM = 512.0
+
 
 def main():
 
     # Check for proper usage
-    if len(sys.argv) != 2:
-        sys.exit("Usage: python heredity.py data.csv")
-    people = load_data(sys.argv[1])
+    parser = argparse.ArgumentParser(usage="python heredity.py data.csv")
+    parser.add_argument("data")
+    parser.add_argument("--engine", choices=ENGINES, default="exact",
+                        help="inference engine to use (default: exact)")
+    parser.add_argument("--workers", type=int, default=1, metavar="N",
+                        help="processes to split enumeration across, or "
+                             "to run separate families on concurrently")
+    parser.add_argument("--probs", metavar="FILE",
+                        help="JSON or YAML file of probabilities to use "
+                             "in place of PROBS")
+    parser.add_argument("--query", metavar="NAME[,NAME...]",
+                        help="only compute distributions for these people, "
+                             "ignoring parts of the pedigree that cannot "
+                             "affect them")
+    parser.add_argument("--top", type=int, metavar="K",
+                        help="print the K most probable assignments of "
+                             "genes and traits instead of distributions")
+    parser.add_argument("--cache", metavar="FILE",
+                        help="SQLite file to look each family's results up "
+                             "in, and to store new results in")
+    parser.add_argument("--cache-size", type=float, default=256,
+                        metavar="MiB",
+                        help="space for cached results before the least "
+                             "recently used are deleted (default: 256)")
+    parser.add_argument("--compiled", action="store_true",
+                        help="read the CSV in bulk and keep the compiled "
+                             "pedigree beside it as DATA.npz, which later "
+                             "runs map into memory until the CSV changes")
+    profile = parser.add_argument_group("profiling options")
+    profile.add_argument("--profile", metavar="FILE",
+                         help="write a JSON profile of the run to FILE "
+                              "(- for standard error)")
+    profile.add_argument("--cprofile", action="store_true",
+                         help="include the slowest functions, as found by "
+                              "cProfile, in the profile")
+    profile.add_argument("--tracemalloc", action="store_true",
+                         help="include peak traced Python memory in the "
+                              "profile")
+    sampling = parser.add_argument_group("sampling options (gibbs engine)")
+    sampling.add_argument("--samples", type=int, metavar="N",
+                          help="draws to take across all chains "
+                               "(default: 100000)")
+    sampling.add_argument("--time-budget", type=float, metavar="SECONDS",
+                          help="stop sampling after this long, counting "
+                               "burn-in and setup")
+    sampling.add_argument("--tolerance", type=float, metavar="SE",
+                          help="stop once every standard error is this "
+                               "small")
+    sampling.add_argument("--chains", type=int, metavar="N",
+                          help="chains to run side by side (default: 256)")
+    sampling.add_argument("--seed", type=int,
+                          help="seed for the random number generator")
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    options = {
+        option: getattr(args, option)
+        for option in ("samples", "time_budget", "tolerance", "chains",
+                       "seed")
+        if getattr(args, option) is not None
+    }
+    if options and args.engine != "gibbs":
+        parser.error("sampling options require --engine gibbs")
+    if args.cache and args.engine == "gibbs":
+        parser.error("--cache cannot be used with --engine gibbs")
+    if args.top is not None:
+        if args.top < 1:
+            parser.error("--top must be at least 1")
+        if args.query or args.cache or options or args.engine != "exact":
+            parser.error("--top cannot be combined with --query, --cache, "
+                         "--engine or sampling options")
+    if (args.cprofile or args.tracemalloc) and not args.profile:
+        parser.error("--cprofile and --tracemalloc require --profile")
+
+    if not args.profile:
+        run(args, options)
+        return
+    with profiling(cprofile=args.cprofile,
+                   memory=args.tracemalloc) as profiler:
+        run(args, options)
+    report = json.dumps(profiler.report(), indent=4)
+    if args.profile == "-":
+        print(report, file=sys.stderr)
+    else:
+        with open(args.profile, "w") as f:
+            f.write(report + "\n")
+
+
+def run(args, options):
+    """
+    Load the data and probabilities named on the command line, then
+    compute and print everyone's distributions.
+    """
+    with timed("load"):
+        try:
+            probs = load_probs(args.probs) if args.probs else PROBS
+            people = load_pedigree(args.data, cache=args.compiled)
+        except (ImportError, OSError, ValueError) as e:
+            sys.exit(str(e))
+
+    # Find the most probable assignments instead, if asked
+    if args.top:
+        with timed("top_configurations"):
+            configurations = top_configurations(people, args.top, probs)
+        print_configurations(people, configurations)
+        return
+
+    # Cut the pedigree down to the part relevant to the query, if any
+    query = None
+    if args.query:
+        query = [name.strip() for name in args.query.split(",")]
+        try:
+            with timed("prune"):
+                people = query_pedigree(people, query)
+        except ValueError as e:
+            sys.exit(str(e))
+
+    # Sample every family at once, reporting standard errors
+    if args.engine == "gibbs":
+        with timed("infer"):
+            probabilities, errors = gibbs_sample(people, probs=probs,
+                                                 **options)
+        if query:
+            probabilities = {person: probabilities[person]
+                             for person in query}
+        print_probabilities(probabilities, errors)
+        return
+
+    # Compute gene and trait probabilities for each person, one family
+    # at a time. Enumeration spreads the workers over each family's
+    # assignments; other engines run families concurrently instead.
+    cache = None
+    if args.cache:
+        cache = ResultCache(args.cache, probs,
+                            max_bytes=int(args.cache_size * 2**20))
+    with timed("infer"):
+        if args.engine in ("enumerate", "pruned"):
+            engine = functools.partial(enumerate_probabilities,
+                                       workers=args.workers, probs=probs,
+                                       prune=args.engine == "pruned")
+            probabilities = infer_families(people, engine, cache=cache)
+        else:
+            engine = functools.partial(ENGINES[args.engine], probs=probs)
+            probabilities = infer_families(people, engine, args.workers,
+                                           cache)
+    if cache is not None:
+        cache.close()
+        if PROFILER is not None:
+            PROFILER.extra["cache"] = {"hits": cache.hits,
+                                       "misses": cache.misses}
+    if query:
+        probabilities = {person: probabilities[person] for person in query}
+    print_probabilities(probabilities)
 
-    # Keep track of gene and trait probabilities for each person
-    probabilities = {
+
+def print_probabilities(probabilities, errors=None):
+    """
+    Print every person's distributions, with standard errors if given.
+    """
+    for person in probabilities:
+        print(f"{person}:")
+        for field in probabilities[person]:
+            print(f"  {field.capitalize()}:")
+            for value in probabilities[person][field]:
+                p = probabilities[person][field][value]
+                if errors is None:
+                    print(f"    {value}: {p:.4f}")
+                else:
+                    error = errors[person][field][value]
+                    print(f"    {value}: {p:.4f} +/- {error:.4f}")
+
+
+def print_configurations(people, configurations):
+    """
+    Print each of `configurations`, as returned by `top_configurations`,
+    with everyone in `people` and their gene count and trait.
+    """
+    for rank, (configuration, log_probability) in enumerate(
+        configurations, 1
+    ):
+        one_gene, two_genes, have_trait = configuration
+        print(f"Configuration {rank}: log probability "
+              f"{log_probability:.4f} (p = {math.exp(log_probability):.4g})")
+        for person in people:
+            genes = 1 if person in one_gene else 2 if person in two_genes \
+                else 0
+            trait = "trait" if person in have_trait else "no trait"
+            print(f"  {person}: {genes} gene{'s' * (genes != 1)}, {trait}")
+
+
+def empty_probabilities(people):
+    """
+    Return a fresh `probabilities` dictionary with every distribution
+    for every person in `people` set to zero.
+    """
+    return {
         person: {
             "gene": {
                 2: 0,
@@ -60,38 +294,140 @@ def main():
         for person in people
     }
 
-    # Loop over all sets of people who might have the trait
-    names = set(people)
-    for have_trait in powerset(names):
 
-        # Check if current set of people violates known information
-        fails_evidence = any(
-            (people[person]["trait"] is not None and
-             people[person]["trait"] != (person in have_trait))
-            for person in names
+def enumerate_probabilities(people, workers=1, probs=None, prune=False):
+    """
+    Compute gene and trait distributions for everyone in `people` by
+    brute-force enumeration of every gene and trait assignment.
+    Cost grows exponentially with the number of people.
+
+    With `prune`, only gene assignments are enumerated: known traits are
+    fixed as evidence, and unknown traits, which nothing else depends
+    on, are summed out for each person's gene count in closed form.
+
+    With more than one worker, the one_gene bitmasks are split into
+    evenly sized shards that are enumerated in separate processes, and
+    only each shard's totals are sent back to be merged.
+    """
+    pedigree = Pedigree.compile(people)
+    model = compile_model(probs)
+    if workers == 1:
+        totals, _ = enumerate_shard(pedigree, model, prune=prune)
+    else:
+        shards = one_gene_shards(len(pedigree), 4 * workers)
+        with ProcessPoolExecutor(workers) as executor:
+            totals, _ = merge_totals(len(pedigree), executor.map(
+                functools.partial(enumerate_shard, prune=prune),
+                itertools.repeat(pedigree), itertools.repeat(model), shards
+            ))
+
+    # Ensure probabilities sum to 1
+    return probabilities_from_totals(pedigree, totals)
+
+
+def enumerate_shard(pedigree, model, one_genes=None, prune=False):
+    """
+    Return the totals (as used by `probabilities_from_totals`) of every
+    assignment agreeing with the known traits in `pedigree`, under the
+    compiled `model`, restricted to the given `one_genes` bitmasks if any.
+    With `prune`, only gene assignments are enumerated (see
+    `enumerate_probabilities`).
+
+    Joint probabilities are computed as logs, and totals are returned
+    along with the log of the scale they are relative to.
+    """
+    if PROFILER is not None:
+        return profiled_enumerate_shard(pedigree, model, one_genes, prune)
+
+    # Keep track of gene and trait totals for each person, by id
+    totals = [[0] * 5 for _ in pedigree]
+    scale = impossible = -math.inf
+    threshold = scale + LOG_HEADROOM
+    exp = math.exp
+
+    if prune:
+        evidence, weights = trait_tables(pedigree, model)
+        for one_gene, two_genes in mask_genotypes(len(pedigree), one_genes):
+            log_p = mask_log_evidence_probability(
+                pedigree, model, evidence, one_gene, two_genes
+            )
+            if log_p > threshold:
+                scale = rescale_totals(totals, scale, log_p)
+                threshold = scale + LOG_HEADROOM
+            elif log_p == impossible:
+                continue
+            mask_update_summed(totals, weights, one_gene, two_genes,
+                               exp(log_p - scale))
+        return totals, scale
+
+    # Stream assignments consistent with known traits, as bitmasks
+    for one_gene, two_genes, have_trait in mask_assignments(
+        pedigree, one_genes
+    ):
+        log_p = mask_log_joint_probability(
+            pedigree, model, one_gene, two_genes, have_trait
         )
-        if fails_evidence:
+        if log_p > threshold:
+            scale = rescale_totals(totals, scale, log_p)
+            threshold = scale + LOG_HEADROOM
+        elif log_p == impossible:
             continue
+        mask_update(totals, one_gene, two_genes, have_trait,
+                    exp(log_p - scale))
 
-        # Loop over all sets of people who might have the gene
-        for one_gene in powerset(names):
-            for two_genes in powerset(names - one_gene):
+    return totals, scale
 
-                # Update probabilities with new joint probability
-                p = joint_probability(people, one_gene, two_genes, have_trait)
-                update(probabilities, one_gene, two_genes, have_trait, p)
 
-    # Ensure probabilities sum to 1
-    normalize(probabilities)
+def rescale_totals(totals, scale, new_scale):
+    """
+    Scale `totals` in place from being relative to the log `scale` to
+    being relative to `new_scale`, and return `new_scale`.
+    """
+    factor = math.exp(scale - new_scale)
+    for person in totals:
+        for value in range(len(person)):
+            person[value] *= factor
+    return new_scale
 
-    # Print results
-    for person in people:
-        print(f"{person}:")
-        for field in probabilities[person]:
-            print(f"  {field.capitalize()}:")
-            for value in probabilities[person][field]:
-                p = probabilities[person][field][value]
-                print(f"    {value}: {p:.4f}")
+
+def merge_totals(n, shards):
+    """
+    Return the sum of several (totals, log scale) pairs for `n` people,
+    as from `enumerate_shard`, as one such pair.
+    """
+    shards = list(shards)
+    scale = max((shard_scale for _, shard_scale in shards),
+                default=-math.inf)
+    totals = [[0] * 5 for _ in range(n)]
+    for shard_totals, shard_scale in shards:
+        if shard_scale == -math.inf:
+            continue
+        factor = math.exp(shard_scale - scale)
+        for person, shard_person in zip(totals, shard_totals):
+            for value, total in enumerate(shard_person):
+                person[value] += total * factor
+    return totals, scale
+
+
+def probabilities_from_totals(pedigree, totals, normalized=True):
+    """
+    Return a `probabilities` dictionary from `totals`, which holds five
+    sums per person in `pedigree`, by id: one for each gene count,
+    followed by one for not having and one for having the trait.
+    Distributions are normalized unless `normalized` is False.
+    """
+    probabilities = empty_probabilities(pedigree)
+    for i, name in enumerate(pedigree.names):
+        for genes in GENES:
+            probabilities[name]["gene"][genes] = float(totals[i][genes])
+        for value in (False, True):
+            probabilities[name]["trait"][value] = float(
+                totals[i][3 + value]
+            )
+    if normalized:
+        with timed("normalize"):
+            normalize(probabilities)
+    return probabilities
 
 
 def load_data(filename):
@@ -101,194 +437,795 @@ def load_data(filename):
     mother, father must both be blank, or both be valid names in the CSV.
     trait should be 0 or 1 if trait is known, blank otherwise.
     """
-    data = dict()
     with open(filename) as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            name = row["name"]
-            data[name] = {
-                "name": name,
-                "mother": row["mother"] or None,
-                "father": row["father"] or None,
-                "trait": (True if row["trait"] == "1" else
-                          False if row["trait"] == "0" else None)
-            }
+        return people_from_rows(csv.DictReader(f))
+
+
+def people_from_rows(rows):
+    """
+    Build a dictionary of people, as returned by `load_data`, from CSV
+    rows given as dictionaries with fields name, mother, father, trait.
+    """
+    data = dict()
+    for row in rows:
+        name = row["name"]
+        data[name] = {
+            "name": name,
+            "mother": row["mother"] or None,
+            "father": row["father"] or None,
+            "trait": (True if row["trait"] == "1" else
+                      False if row["trait"] == "0" else None)
+        }
     return data
 
 
-def powerset(s):
+class Pedigree:
     """
-    Return a list of all possible subsets of set s.
+    A compiled pedigree, with everyone's name interned to an integer id
+    (their position in `names`) and their mother, father and trait held
+    in parallel arrays. Unknown parents are -1, and traits are 1 or 0
+    if known and -1 otherwise.
+
+    Founders, each person's children and a topological order (everyone
+    after their parents) are worked out once up front. Iterating over a
+    pedigree gives names, like the dictionary from `load_data`.
     """
-    s = list(s)
-    return [
-        set(s) for s in itertools.chain.from_iterable(
-            itertools.combinations(s, r) for r in range(len(s) + 1)
+
+    __slots__ = (
+        "names", "ids", "mothers", "fathers", "traits",
+        "founders", "children", "order"
+    )
+
+    def __init__(self, names, mothers, fathers, traits):
+        self.names = list(names)
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        self.mothers = array("l", mothers)
+        self.fathers = array("l", fathers)
+        self.traits = array("b", traits)
+
+        self.founders = []
+        self.children = [[] for _ in self.names]
+        for i in range(len(self.names)):
+            mother = self.mothers[i]
+            father = self.fathers[i]
+            if (mother < 0) != (father < 0):
+                raise ValueError(
+                    f"{self.names[i]} must have both parents or neither"
+                )
+            if mother < 0:
+                self.founders.append(i)
+            else:
+                for parent in {mother, father}:
+                    self.children[parent].append(i)
+        self.order = self.topological_order()
+
+    def __reduce__(self):
+        # Columns may be read-only views of a mapped file, which cannot
+        # be pickled, so send copies and work the rest out again
+        return Pedigree, (self.names, array("l", self.mothers),
+                          array("l", self.fathers), array("b", self.traits))
+
+    @classmethod
+    def from_columns(cls, names, mothers, fathers, traits, founders,
+                     children, order=None):
+        """
+        Return a pedigree made from columns that have already been
+        checked, such as those of a compiled pedigree file, using them as
+        they are rather than copying them. `children` may be any sequence
+        of each person's children. The topological order is worked out
+        unless given.
+        """
+        pedigree = cls.__new__(cls)
+        pedigree.names = names
+        pedigree.ids = dict(zip(names, range(len(names))))
+        pedigree.mothers = mothers
+        pedigree.fathers = fathers
+        pedigree.traits = traits
+        pedigree.founders = founders
+        pedigree.children = children
+        pedigree.order = order or pedigree.topological_order()
+        return pedigree
+
+    @classmethod
+    def compile(cls, people):
+        """
+        Return a pedigree for `people`, a dictionary as returned by
+        `load_data`. Pedigrees are returned unchanged.
+        """
+        if isinstance(people, cls):
+            return people
+        ids = {name: i for i, name in enumerate(people)}
+
+        def parent_id(person, parent):
+            name = people[person][parent]
+            if name is None:
+                return -1
+            if name not in ids:
+                raise ValueError(f"{person}'s {parent} {name} is not listed")
+            return ids[name]
+
+        return cls(
+            people,
+            [parent_id(person, "mother") for person in people],
+            [parent_id(person, "father") for person in people],
+            [-1 if people[person]["trait"] is None
+             else int(people[person]["trait"])
+             for person in people]
+        )
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def is_founder(self, i):
+        """
+        Return whether person `i` has no parents in the pedigree.
+        """
+        return self.mothers[i] < 0
+
+    def trait(self, i):
+        """
+        Return person `i`'s trait as True, False or None if unknown.
+        """
+        trait = self.traits[i]
+        return None if trait < 0 else bool(trait)
+
+    def topological_order(self):
+        """
+        Return every id, ordered so that everyone comes after their
+        mother and father.
+        """
+        waiting = [0 if mother < 0 else 1 if mother == father else 2
+                   for mother, father in zip(self.mothers, self.fathers)]
+        order = list(self.founders)
+        for i in order:
+            for child in self.children[i]:
+                waiting[child] -= 1
+                if not waiting[child]:
+                    order.append(child)
+        if len(order) != len(self.names):
+            raise ValueError("pedigree has someone as their own ancestor")
+        return order
+
+    def subset(self, ids):
+        """
+        Return a new pedigree of just the people with the given `ids`,
+        which must include the parents of everyone in it.
+        """
+        ids = list(ids)
+        new_ids = {old: new for new, old in enumerate(ids)}
+        return Pedigree(
+            [self.names[i] for i in ids],
+            [new_ids[self.mothers[i]] if self.mothers[i] >= 0 else -1
+             for i in ids],
+            [new_ids[self.fathers[i]] if self.fathers[i] >= 0 else -1
+             for i in ids],
+            [self.traits[i] for i in ids]
         )
-    ]
 
 
-def joint_probability(people, one_gene, two_genes, have_trait):
+class ChildLists:
     """
-    Compute and return a joint probability.
-``
-    The probability returned should be the probability that
-        * everyone in set `one_gene` has one copy of the gene, and
-        * everyone in set `two_genes` has two copies of the gene, and
-        * everyone not in `one_gene` or `two_gene` does not have the gene, and
-        * everyone in set `have_trait` has the trait, and
-        * everyone not in set` have_trait` does not have the trait.
+    Everyone's children held flat, person i's being `flat[offsets[i]]`
+    up to `flat[offsets[i + 1]]`, and indexed like a list of lists.
     """
 
-    # calculate the probability that everyone in set 'one gene' has one copy of the gene
-    one_gene_probabilities = []
-    for person in one_gene:
-        # check who the parents of the person are
-        person_mother = people[person]['mother']
-        person_father = people[person]['father']
+    __slots__ = ("offsets", "flat")
 
-        # if person has no parents, use the probability distribution PROBS['genes']
-        if person_father == None:
-            if person_mother == None:
-                one_gene_probabilities.append(PROBS['gene'][1])
-                continue
+    def __init__(self, offsets, flat):
+        self.offsets = offsets
+        self.flat = flat
 
-        # either person gets the gene from his mother and not his father
-        # or he gets it from his father and not his mother
-        if person_father in one_gene:
-            father_passing_probability = (0.5 * 0.99) + (0.5 * 0.01)  # passes sick gene and it doesnt mutate OR passes healthy gene and it mutates
-        elif person_father in two_genes:
-            father_passing_probability = 0.99 # 1 - 0.01 (the probability of mutation to not the specified gene)
-        else:
-            father_passing_probability = 0.01 # (the probability of not the specified gene mutating into the specified gene)
+    def __getitem__(self, i):
+        return self.flat[self.offsets[i]:self.offsets[i + 1]]
 
+    def __len__(self):
+        return len(self.offsets) - 1
 
-        if person_mother in one_gene:
-            mother_passing_probability = (0.5 * 0.99) + (0.5 * 0.01) # passes sick gene and it doesnt mutate OR passes healthy gene and it mutates
-        elif person_mother in two_genes:
-            mother_passing_probability = 0.99 # 1 - 0.01 (the probability of mutation to not the specified gene)
-        else:
-            mother_passing_probability = 0.01 # (the probability of not the specified gene mutating into the specified gene)
-        
-        # probability = gets gene ONLY from mother OR gets gene ONLY from father
-        probability = mother_passing_probability * (1 - father_passing_probability) + (1 - mother_passing_probability) * father_passing_probability
-        # add the probability of person having one gene to the list of probabilities
-        one_gene_probabilities.append(probability)
-
-    two_genes_probabilities = []
-    for person in two_genes:
-        # check who the parents of the person are
-        person_mother = people[person]['mother']
-        person_father = people[person]['father']
-
-        # if person has no parents, use the probability distribution PROBS['genes']
-        if person_father == None:
-            if person_mother == None:
-                two_genes_probabilities.append(PROBS['gene'][2])
-                continue
 
-        # check probability of passing the gene by persons parents
-        if person_father in one_gene:
-            father_passing_probability = (0.5 * 0.99) + (0.5 * 0.01) # passes sick gene and it doesnt mutate OR passes healthy gene and it mutates
-        elif person_father in two_genes:
-            father_passing_probability = 0.99 # 1 - 0.01 (the probability of mutation to not the specified gene)
-        else:
-            father_passing_probability = 0.01 # (the probability of not the specified gene mutating into the specified gene)
+# Trait codes accepted by `read_pedigree_csv`
+TRAIT_CODES = {"": -1, "0": 0, "1": 1}
 
+# Version of the compiled pedigree file written by `save_compiled`
+COMPILED_VERSION = 1
 
-        if person_mother in one_gene:
-            mother_passing_probability = (0.5 * 0.99) + (0.5 * 0.01) # passes sick gene and it doesnt mutate OR passes healthy gene and it mutates
-        elif person_mother in two_genes:
-            mother_passing_probability = 0.99 # 1 - 0.01 (the probability of mutation to not the specified gene)
-        else:
-            mother_passing_probability = 0.01 # (the probability of not the specified gene mutating into the specified gene)
 
-        # probability = mother passed the gene AND father passed the gene
-        two_genes_probability = mother_passing_probability * father_passing_probability
-        # add the probability of person having the gene to list of probabilities
-        two_genes_probabilities.append(two_genes_probability)
+def load_pedigree(filename, cache=False):
+    """
+    Load gene and trait data from a CSV file, as for `load_data`,
+    into a compiled `Pedigree`.
+
+    With `cache`, the CSV is read in bulk by `read_pedigree_csv` instead
+    and the pedigree saved beside it as FILENAME.npz, which later calls
+    map straight into memory for as long as the CSV is unchanged.
+    """
+    if not cache:
+        return Pedigree.compile(load_data(filename))
+    compiled = filename + ".npz"
+    pedigree = open_compiled(compiled, filename)
+    if pedigree is None:
+        pedigree = read_pedigree_csv(filename)
+        save_compiled(pedigree, compiled, filename)
+    return pedigree
 
-    no_gene_probabilities = []
-    # get a list of all people not in one_gene or two_gene
-    no_gene_people = []
-    for person in people:
-        if person not in one_gene and person not in two_genes:
-            no_gene_people.append(person)
-    
-    for person in no_gene_people:
-        # check who the parents of the person are
-        person_mother = people[person]['mother']
-        person_father = people[person]['father']
-
-        # if person has no parents, use the probability distribution PROBS['genes']
-        if person_father == None:
-            if person_mother == None:
-                no_gene_probabilities.append(PROBS['gene'][0])
-                continue
-        
-        # check probability of passing the gene by persons parents
-        if person_father in one_gene:
-            father_passing_probability = (0.5 * 0.99) + (0.5 * 0.01) # passes sick gene and it doesnt mutate OR passes healthy gene and it mutates
-        elif person_father in two_genes:
-            father_passing_probability = 0.99 # 1 - 0.01 (the probability of mutation to not the specified gene)
-        else:
-            father_passing_probability = 0.01 # (the probability of not the specified gene mutating into the specified gene)
 
+def read_pedigree_csv(filename, chunk_size=2 ** 16):
+    """
+    Read a CSV file in the form of `load_data` straight into a compiled
+    `Pedigree`, without a dictionary per person. Rows are read
+    `chunk_size` at a time into columns, names are interned into integer
+    ids in bulk, and trait codes and parent references are then checked
+    a whole NumPy column at a time.
 
-        if person_mother in one_gene:
-            mother_passing_probability = (0.5 * 0.99) + (0.5 * 0.01) # 0.5 - 0.01 (the probability of mutation to not the specified gene)
-        elif person_mother in two_genes:
-            mother_passing_probability = 0.99 # 1 - 0.01 (the probability of mutation to not the specified gene)
-        else:
-            mother_passing_probability = 0.01 # (the probability of not the specified gene mutating into the specified gene)
+    Unlike `load_data`, any trait other than 0, 1 or blank is an error,
+    as is anyone listed more than once.
+    """
+    require_numpy()
+    names, mothers, fathers, traits = [], [], [], []
+    try:
+        with open(filename, newline="") as f:
+            reader = csv.reader(f)
+            header = next(reader, [])
+            columns = ("name", "mother", "father", "trait")
+            if not set(columns) <= set(header):
+                raise ValueError(f"{filename} must have name, mother, "
+                                 f"father and trait columns")
+            indices = [header.index(column) for column in columns]
+            fields = operator.itemgetter(*indices)
+            width = max(indices) + 1
+            while True:
+                rows = list(itertools.islice(reader, chunk_size))
+                if not rows:
+                    break
 
-        # probability = father NOT passing gene AND mother NOT passing gene
-        probability = (1 - mother_passing_probability)  * (1 - father_passing_probability)
+                # Skip blank lines and treat missing fields as blank, as
+                # `csv.DictReader` does
+                if min(map(len, rows)) < width:
+                    rows = [row + [""] * (width - len(row))
+                            for row in rows if row]
+                    if not rows:
+                        continue
+                chunk = list(zip(*map(fields, rows)))
+                codes = np.fromiter(
+                    map(TRAIT_CODES.get, chunk[3], itertools.repeat(-2)),
+                    dtype=np.int8, count=len(rows)
+                )
+                invalid = codes == -2
+                if invalid.any():
+                    i = np.argmax(invalid)
+                    raise ValueError(f"{chunk[0][i]}'s trait {chunk[3][i]} "
+                                     f"is not 0, 1 or blank")
+                names.extend(chunk[0])
+                mothers.extend(chunk[1])
+                fathers.extend(chunk[2])
+                traits.append(codes)
+    except csv.Error as error:
+        raise ValueError(f"{filename}: {error}")
 
-        no_gene_probabilities.append(probability)
+    n = len(names)
+    ids = dict(zip(names, range(n)))
+    if len(ids) != n:
+        # Only the last of anyone listed twice keeps their id
+        kept = np.zeros(n, dtype=bool)
+        kept[np.fromiter(ids.values(), dtype=np.int64, count=len(ids))] = True
+        raise ValueError(f"{names[np.argmin(kept)]} is listed more than once")
 
-    # calculate probabilities for persons to have trait
-    have_trait_probabilities = []
-    for person in have_trait:
-        # calculate probability of trait, given 0 genes
-        if person not in one_gene and person not in two_genes:
-            probability = PROBS['trait'][0][True]
-        # calculate probability of trait, given 1 gene
-        if person in one_gene:
-            probability = PROBS['trait'][1][True]
-        # calculate probability of trait, given 2 genes
-        if person in two_genes:
-            probability = PROBS['trait'][2][True]
+    def parent_ids(parents, parent):
+        known = np.fromiter(map(bool, parents), dtype=bool, count=n)
+        found = np.fromiter(map(ids.get, parents, itertools.repeat(-1)),
+                            dtype=np.int64, count=n)
+        missing = known & (found < 0)
+        if missing.any():
+            i = np.argmax(missing)
+            raise ValueError(
+                f"{names[i]}'s {parent} {parents[i]} is not listed"
+            )
+        return np.where(known, found, -1)
 
-        have_trait_probabilities.append(probability)
+    mothers = parent_ids(mothers, "mother")
+    fathers = parent_ids(fathers, "father")
+    one_parent = (mothers < 0) != (fathers < 0)
+    if one_parent.any():
+        raise ValueError(
+            f"{names[np.argmax(one_parent)]} must have both parents or neither"
+        )
+    traits = np.concatenate(traits) if traits else np.array([], np.int8)
 
-    # calculate probabilities for persons to not have trait
-    not_have_trait_probabilities = []
-    for person in people:
-        if person not in have_trait:
-            # calculate probability of no trait, given 0 genes
+    # Everyone's children in id order, counting a parent only once if
+    # they are both mother and father
+    children = np.flatnonzero(mothers >= 0)
+    distinct = children[fathers[children] != mothers[children]]
+    parents = np.concatenate([mothers[children], fathers[distinct]])
+    children = np.concatenate([children, distinct])
+    children = children[np.lexsort((children, parents))]
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(parents, minlength=n), out=offsets[1:])
 
-            if person not in one_gene and person not in two_genes:
-                probability = PROBS['trait'][0][False]
-            # calculate probability of no trait, given 1 gene
-            if person in one_gene:
-                probability = PROBS['trait'][1][False]
-            # calculate probability of no trait, given 2 genes
-            if person in two_genes:
-                probability = PROBS['trait'][2][False]
-            
-            not_have_trait_probabilities.append(probability)
+    return Pedigree.from_columns(
+        names, memoryview(mothers), memoryview(fathers),
+        memoryview(traits), np.flatnonzero(mothers < 0).tolist(),
+        ChildLists(memoryview(offsets), memoryview(children))
+    )
 
-    all_probabilities = one_gene_probabilities + two_genes_probabilities + no_gene_probabilities + have_trait_probabilities + not_have_trait_probabilities
 
+def save_compiled(pedigree, filename, source):
+    """
+    Save `pedigree` as an uncompressed `.npz` file at `filename` that
+    `open_compiled` can map into memory, marked with the modification
+    time, size and SHA-256 hash of the `source` file it was read from.
+    """
+    require_numpy()
+    names = "\0".join(pedigree.names).encode()
+    children = pedigree.children
+    if not isinstance(children, ChildLists):
+        children = ChildLists(
+            np.cumsum([0] + [len(c) for c in children]),
+            [child for c in children for child in c]
+        )
+    arrays = {
+        "version": np.array([COMPILED_VERSION]),
+        "source": np.array(source_signature(source), dtype=np.int64),
+        "digest": np.frombuffer(file_digest(source), dtype=np.uint8),
+        "names": np.frombuffer(names, dtype=np.uint8),
+        "mothers": np.asarray(pedigree.mothers, dtype=np.int64),
+        "fathers": np.asarray(pedigree.fathers, dtype=np.int64),
+        "traits": np.asarray(pedigree.traits, dtype=np.int8),
+        "order": np.asarray(pedigree.order, dtype=np.int64),
+        "offsets": np.asarray(children.offsets, dtype=np.int64),
+        "children": np.asarray(children.flat, dtype=np.int64)
+    }
+    replace_npz(filename, arrays)
+
+
+def replace_npz(filename, arrays):
+    """
+    Write `arrays` to `filename` with `write_npz`, by way of a temporary
+    file so that readers never see half of one.
+    """
+    temporary = f"{filename}.{os.getpid()}.tmp"
+    try:
+        write_npz(temporary, arrays)
+        os.replace(temporary, filename)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temporary)
+        raise
+
+
+def open_compiled(filename, source):
+    """
+    Return the pedigree saved by `save_compiled` at `filename`, with its
+    columns mapped read-only from the file rather than read into memory,
+    or None if there is no such file or the `source` file has changed
+    since. A source whose modification time has changed but whose size
+    and contents have not still counts as unchanged, and the new time is
+    saved so that it is not hashed again.
+    """
+    require_numpy()
+    try:
+        arrays = map_npz(filename)
+    except (OSError, ValueError, zipfile.BadZipFile):
+        return None
+    if ("version" not in arrays or
+            arrays["version"].tolist() != [COMPILED_VERSION]):
+        return None
+    modified, size = arrays["source"].tolist()
+    try:
+        signature = source_signature(source)
+    except OSError:
+        return None
+    if signature != (modified, size):
+        if (signature[1] != size or
+                file_digest(source) != arrays["digest"].tobytes()):
+            return None
+        arrays = dict(arrays, source=np.array(signature, dtype=np.int64))
+        with contextlib.suppress(OSError):
+            replace_npz(filename, arrays)
+
+    n = len(arrays["mothers"])
+    names = arrays["names"].tobytes().decode().split("\0") if n else []
+    return Pedigree.from_columns(
+        names, memoryview(arrays["mothers"]), memoryview(arrays["fathers"]),
+        memoryview(arrays["traits"]),
+        np.flatnonzero(arrays["mothers"] < 0).tolist(),
+        ChildLists(memoryview(arrays["offsets"]),
+                   memoryview(arrays["children"])),
+        arrays["order"].tolist()
+    )
+
+
+def write_npz(filename, arrays):
+    """
+    Write the dictionary `arrays` to an uncompressed `.npz` file at
+    `filename`, as `numpy.savez` does, but with each array's data padded
+    to start on a 64-byte boundary of the file so it can be mapped.
+    """
+    with open(filename, "wb") as f, zipfile.ZipFile(f, "w") as archive:
+        for name, values in arrays.items():
+            data = io.BytesIO()
+            np.lib.format.write_array(data, values, allow_pickle=False)
+            data = data.getvalue()
+            info = zipfile.ZipInfo(name + ".npy", (1980, 1, 1, 0, 0, 0))
+
+            # Pad the local header with an extra field of our own, after
+            # which zipfile adds its own if the array is very large
+            start = (f.tell() + 30 + len(info.filename.encode()) +
+                     len(data) - values.nbytes + 4)
+            if len(data) * 1.05 > zipfile.ZIP64_LIMIT:
+                start += 20
+            padding = -start % 64
+            info.extra = struct.pack("<HH", 0xD935, padding) + bytes(padding)
+            archive.writestr(info, data)
+
+
+def map_npz(filename):
+    """
+    Return a dictionary of the arrays in the uncompressed `.npz` file at
+    `filename`, each a read-only view of the file mapped into memory.
+    (`numpy.load` ignores `mmap_mode` for `.npz` files.) Arrays not
+    aligned in the file, as `write_npz` aligns them, are copied instead.
+    """
+    arrays = dict()
+    with open(filename, "rb") as f, zipfile.ZipFile(f) as archive:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{filename} is compressed")
+
+            # Skip the member's local header, then its array header
+            name_length, extra_length = struct.unpack(
+                "<HH", mapped[info.header_offset + 26:info.header_offset + 30]
+            )
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+            if fortran or dtype.hasobject or not dtype.isnative:
+                raise ValueError(f"{filename} holds unexpected arrays")
+
+            # Plain native types, so that memoryviews can be indexed too
+            values = np.frombuffer(
+                mapped, dtype=np.dtype(dtype.type), count=math.prod(shape),
+                offset=f.tell()
+            ).reshape(shape)
+            if not values.flags.aligned:
+                values = values.copy()
+            arrays[info.filename.removesuffix(".npy")] = values
+    return arrays
+
+
+def source_signature(filename):
+    """
+    Return the modification time in nanoseconds and size of `filename`.
+    """
+    stat = os.stat(filename)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def file_digest(filename):
+    """
+    Return the SHA-256 hash of the contents of `filename`.
+    """
+    digest = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for block in iter(functools.partial(f.read, 2 ** 20), b""):
+            digest.update(block)
+    return digest.digest()
+
+
+def split_families(people):
+    """
+    Split `people` into families of people connected through mother and
+    father links. Return a list of pedigrees, in order of each family's
+    first appearance.
+    """
+    pedigree = Pedigree.compile(people)
+    roots = list(range(len(pedigree)))
+
+    def find(i):
+        while roots[i] != i:
+            roots[i] = roots[roots[i]]
+            i = roots[i]
+        return i
+
+    for i in range(len(pedigree)):
+        if not pedigree.is_founder(i):
+            roots[find(i)] = find(pedigree.mothers[i])
+            roots[find(i)] = find(pedigree.fathers[i])
+
+    families = dict()
+    for i in range(len(pedigree)):
+        families.setdefault(find(i), []).append(i)
+    if len(families) == 1:
+        return [pedigree]
+    return [pedigree.subset(ids) for ids in families.values()]
+
+
+def infer_families(people, engine=None, workers=1, cache=None):
+    """
+    Compute gene and trait distributions for everyone in `people` by
+    running `engine` (exact inference by default) on each family from
+    `split_families` on its own, spread across `workers` processes if
+    more than one. Unrelated families are independent, so the total cost
+    is the sum of their costs rather than the product.
+
+    With a `ResultCache`, families whose distributions are already stored
+    are looked up instead, and the rest are stored once computed.
+    """
+    engine = engine or infer
+    families = split_families(people)
+
+    probabilities = dict()
+    if cache is not None:
+        keys = []
+        missing = []
+        for family in families:
+            key = cache.key(family)
+            result = cache.get(key)
+            if result is None:
+                keys.append(key)
+                missing.append(family)
+            else:
+                probabilities.update(result)
+        families = missing
+
+    if workers > 1 and len(families) > 1:
+        with ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(engine, families))
+    else:
+        results = map(engine, families)
+
+    for i, result in enumerate(results):
+        probabilities.update(result)
+        if cache is not None:
+            cache.put(keys[i], result)
+    return {person: probabilities[person] for person in people}
+
+
+class ResultCache:
+    """
+    Distributions computed for whole families, stored in an SQLite
+    database under a hash of the family and of the probabilities used,
+    so that a family seen before costs a hash and a lookup. Each result
+    is stored as five doubles per person.
+
+    Results must come from an exact engine using the same probabilities
+    as the cache. New results and the times results were used are saved
+    together every `commit_every` changes and on closing, when the least
+    recently used are deleted if results take up more than `max_bytes`.
+    """
+
+    def __init__(self, filename, probs=None, max_bytes=256 * 2**20,
+                 commit_every=1000):
+        self.model = compile_model(probs)
+        self.max_bytes = max_bytes
+        self.commit_every = commit_every
+        self.connection = sqlite3.connect(filename, timeout=60)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, data BLOB NOT NULL, used REAL NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS results_used ON results (used)"
+        )
+        self.size, = self.connection.execute(
+            "SELECT COALESCE(SUM(LENGTH(data)), 0) FROM results"
+        ).fetchone()
+        self.used = dict()
+        self.added = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def key(self, family):
+        """
+        Return the key for `family`, a pedigree or dictionary of people:
+        a hash of everyone's name, parents and trait, in name order, and
+        of the cache's probabilities, along with the names in that order.
+        """
+        pedigree = Pedigree.compile(family)
+        names = sorted(pedigree.names)
+
+        def parent(i):
+            return pedigree.names[i] if i >= 0 else ""
+
+        rows = [
+            [name, parent(pedigree.mothers[i]), parent(pedigree.fathers[i]),
+             pedigree.traits[i]]
+            for name, i in zip(names, map(pedigree.ids.get, names))
+        ]
+        digest = hashlib.sha256(
+            json.dumps([self.model.key, rows]).encode()
+        ).hexdigest()
+        return digest, names
+
+    def get(self, key):
+        """
+        Return the distributions stored under `key`, as returned by
+        `key`, or None if there are none.
+        """
+        digest, names = key
+        row = self.connection.execute(
+            "SELECT data FROM results WHERE key = ?", (digest,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.used[digest] = time.time()
+        if len(self.used) + self.added >= self.commit_every:
+            self.commit()
+
+        values = array("d")
+        values.frombytes(row[0])
+        probabilities = empty_probabilities(names)
+        for i, name in enumerate(names):
+            for genes in GENES:
+                probabilities[name]["gene"][genes] = values[5 * i + genes]
+            probabilities[name]["trait"][True] = values[5 * i + 3]
+            probabilities[name]["trait"][False] = values[5 * i + 4]
+        return probabilities
+
+    def put(self, key, probabilities):
+        """
+        Store `probabilities` for everyone in the family under `key`.
+        """
+        digest, names = key
+        values = array("d")
+        for name in names:
+            distribution = probabilities[name]
+            values.extend(distribution["gene"][genes] for genes in GENES)
+            values.append(distribution["trait"][True])
+            values.append(distribution["trait"][False])
+        self.connection.execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+            (digest, values.tobytes(), time.time())
+        )
+        self.size += len(values) * values.itemsize
+        self.added += 1
+        if len(self.used) + self.added >= self.commit_every:
+            self.commit()
 
-    final_probability = 1
+    def commit(self):
+        """
+        Save changes, recording when results were last used and deleting
+        the least recently used until the rest fit in `max_bytes`.
+        """
+        self.connection.executemany(
+            "UPDATE results SET used = ? WHERE key = ?",
+            [(used, digest) for digest, used in self.used.items()]
+        )
+        self.used.clear()
+        self.added = 0
+        if self.size > self.max_bytes:
+            stale = []
+            for digest, length in self.connection.execute(
+                "SELECT key, LENGTH(data) FROM results ORDER BY used"
+            ):
+                if self.size <= self.max_bytes:
+                    break
+                stale.append((digest,))
+                self.size -= length
+            self.connection.executemany(
+                "DELETE FROM results WHERE key = ?", stale
+            )
+        self.connection.commit()
+
+    def close(self):
+        """
+        Save changes and close the database.
+        """
+        self.commit()
+        self.connection.close()
+
+
+def query_pedigree(people, query):
+    """
+    Return the smallest pedigree from `people` that gives the same
+    distributions for everyone named in `query` as the whole of it.
+
+    Only people whose trait is known, the queried people and their
+    ancestors can affect the query: anyone else is a barren node, with
+    no evidence at or below them, and sums out to nothing. Of those left,
+    families with nobody queried are independent of the query.
+    """
+    pedigree = Pedigree.compile(people)
+    for name in query:
+        if name not in pedigree:
+            raise ValueError(f"{name} is not in the pedigree")
+
+    # Keep the queried and observed people and all of their ancestors
+    relevant = set()
+    stack = [pedigree.ids[name] for name in query] + [
+        i for i, trait in enumerate(pedigree.traits) if trait >= 0
+    ]
+    while stack:
+        i = stack.pop()
+        if i in relevant:
+            continue
+        relevant.add(i)
+        if not pedigree.is_founder(i):
+            stack.append(pedigree.mothers[i])
+            stack.append(pedigree.fathers[i])
+    pruned = pedigree.subset(sorted(relevant))
+
+    # Keep only the families of queried people
+    families = [
+        family for family in split_families(pruned)
+        if any(name in family for name in query)
+    ]
+    ids = sorted(pruned.ids[name] for family in families for name in family)
+    return pruned.subset(ids) if len(ids) < len(pruned) else pruned
+
+
+def infer_query(people, query, engine=None, workers=1):
+    """
+    Compute gene and trait distributions for just the people named in
+    `query`, running `engine` (as for `infer_families`) only on the part
+    of `people` that can affect them. Returns them in `query` order.
+    """
+    probabilities = infer_families(query_pedigree(people, query), engine,
+                                   workers)
+    return {person: probabilities[person] for person in query}
+
+
+def powerset(s):
+    """
+    Return a list of all possible subsets of set s.
+    """
+    s = list(s)
+    return [
+        set(s) for s in itertools.chain.from_iterable(
+            itertools.combinations(s, r) for r in range(len(s) + 1)
+        )
+    ]
+
+
+def joint_probability(people, one_gene, two_genes, have_trait, probs=None):
+    """
+    Compute and return a joint probability.
 
-    for probability in all_probabilities:
-        final_probability = final_probability * probability
+    The probability returned should be the probability that
+        * everyone in set `one_gene` has one copy of the gene, and
+        * everyone in set `two_genes` has two copies of the gene, and
+        * everyone not in `one_gene` or `two_gene` does not have the gene, and
+        * everyone in set `have_trait` has the trait, and
+        * everyone not in set` have_trait` does not have the trait.
+    """
+    model = compile_model(probs)
+
+    def genes(person):
+        return 1 if person in one_gene else 2 if person in two_genes else 0
 
+    probability = 1
+    for person in people:
+        mother = people[person]["mother"]
+        father = people[person]["father"]
+
+        # people without parents use the unconditional distribution,
+        # everyone else inherits from their parents
+        if mother is None and father is None:
+            probability *= model.prior[genes(person)]
+        else:
+            probability *= model.inheritance[genes(person)][genes(mother)][
+                genes(father)
+            ]
+
+        probability *= model.trait[genes(person)][person in have_trait]
 
-    return final_probability
+    return probability
 
 
 def update(probabilities, one_gene, two_genes, have_trait, p):
@@ -331,6 +1268,1831 @@ def normalize(probabilities):
                 probabilities[person][gene_trait][category] = float(probabilities[person][gene_trait][category]) / total_distribution
 
 
+def submasks(mask):
+    """
+    Lazily generate every subset of the bits set in `mask`,
+    starting from `mask` itself and ending with 0.
+    """
+    subset = mask
+    while True:
+        yield subset
+        if not subset:
+            return
+        subset = (subset - 1) & mask
+
+
+def mask_assignments(pedigree, one_genes=None):
+    """
+    Lazily generate every assignment of genes and traits that agrees
+    with the known traits in `pedigree`, as bitmasks
+    (one_gene, two_genes, have_trait) where bit i stands for person i.
+    If `one_genes` is given, only those one_gene bitmasks are used.
+    """
+    everyone = (1 << len(pedigree)) - 1
+    known = 0
+    known_traits = 0
+    for i, trait in enumerate(pedigree.traits):
+        if trait >= 0:
+            known |= 1 << i
+            known_traits |= trait << i
+
+    for have_trait in range(everyone + 1):
+
+        # Skip sets of people that violate known information
+        if have_trait & known != known_traits:
+            continue
+
+        for one_gene, two_genes in mask_genotypes(len(pedigree), one_genes):
+            yield one_gene, two_genes, have_trait
+
+
+def mask_genotypes(n, one_genes=None):
+    """
+    Lazily generate every assignment of gene counts to `n` people as
+    bitmasks (one_gene, two_genes). If `one_genes` is given, only those
+    one_gene bitmasks are used.
+    """
+    everyone = (1 << n) - 1
+    if one_genes is None:
+        one_genes = range(everyone + 1)
+    for one_gene in one_genes:
+        for two_genes in submasks(everyone & ~one_gene):
+            yield one_gene, two_genes
+
+
+def one_gene_shards(n, count):
+    """
+    Split the one_gene bitmasks over `n` people into at most `count`
+    ranges, each with about the same number of two_genes subsets to
+    enumerate (a one_gene mask with k people set has 2 ** (n - k)).
+    """
+    target = 3 ** n / count
+    shards = []
+    start = 0
+    weight = 0
+    for one_gene in range(1 << n):
+        weight += 1 << (n - bin(one_gene).count("1"))
+        if weight >= target:
+            shards.append(range(start, one_gene + 1))
+            start = one_gene + 1
+            weight = 0
+    if start < 1 << n:
+        shards.append(range(start, 1 << n))
+    return shards
+
+
+def mask_genes(one_gene, two_genes, i):
+    """
+    Return how many copies of the gene person i has in an assignment.
+    """
+    return (one_gene >> i & 1) + 2 * (two_genes >> i & 1)
+
+
+def mask_log_joint_probability(pedigree, model, one_gene, two_genes,
+                               have_trait):
+    """
+    Compute the natural log of the joint probability that
+    `joint_probability` returns, under the compiled `model`, for an
+    assignment given as bitmasks over the people in `pedigree`. Returns
+    -inf if the joint probability is zero.
+    """
+    log_probability = 0.0
+    mothers = pedigree.mothers
+    fathers = pedigree.fathers
+    log_prior = model.log_prior
+    log_inheritance = model.log_inheritance
+    log_trait = model.log_trait
+    for i in range(len(pedigree)):
+        genes = mask_genes(one_gene, two_genes, i)
+        if mothers[i] < 0:
+            log_probability += log_prior[genes]
+        else:
+            log_probability += log_inheritance[genes][
+                mask_genes(one_gene, two_genes, mothers[i])
+            ][mask_genes(one_gene, two_genes, fathers[i])]
+        log_probability += log_trait[genes][have_trait >> i & 1]
+    return log_probability
+
+
+def mask_update(totals, one_gene, two_genes, have_trait, p):
+    """
+    Add a new joint probability `p` to `totals` (as used by
+    `probabilities_from_totals`) for an assignment given as bitmasks.
+    """
+    for i, person in enumerate(totals):
+        person[mask_genes(one_gene, two_genes, i)] += p
+        person[3 + (have_trait >> i & 1)] += p
+
+
+def trait_tables(pedigree, model):
+    """
+    Return two tables indexed by person id and then gene count, for
+    enumerating gene assignments only. The first holds the log
+    probability of each person's known trait (0 if unknown), and the
+    second the chances of not having and having the trait given what is
+    known.
+    """
+    evidence = []
+    weights = []
+    for i in range(len(pedigree)):
+        trait = pedigree.traits[i]
+        if trait < 0:
+            evidence.append([0.0] * len(GENES))
+            weights.append(model.trait)
+        else:
+            evidence.append(
+                [model.log_trait[genes][trait] for genes in GENES]
+            )
+            weights.append([[1 - trait, trait]] * len(GENES))
+    return evidence, weights
+
+
+def mask_log_evidence_probability(pedigree, model, evidence, one_gene,
+                                  two_genes):
+    """
+    Compute the log joint probability of a gene assignment, given as
+    bitmasks, and the known traits in `pedigree`, with unknown traits
+    summed out. `evidence` is the first table from `trait_tables`.
+    """
+    log_probability = 0.0
+    mothers = pedigree.mothers
+    fathers = pedigree.fathers
+    log_prior = model.log_prior
+    log_inheritance = model.log_inheritance
+    for i in range(len(pedigree)):
+        genes = mask_genes(one_gene, two_genes, i)
+        if mothers[i] < 0:
+            log_probability += log_prior[genes]
+        else:
+            log_probability += log_inheritance[genes][
+                mask_genes(one_gene, two_genes, mothers[i])
+            ][mask_genes(one_gene, two_genes, fathers[i])]
+        log_probability += evidence[i][genes]
+    return log_probability
+
+
+def mask_update_summed(totals, weights, one_gene, two_genes, p):
+    """
+    Add the joint probability `p` of a gene assignment, given as bitmasks,
+    to `totals`, splitting it between not having and having the trait
+    according to `weights`, the second table from `trait_tables`.
+    """
+    for i, person in enumerate(totals):
+        genes = mask_genes(one_gene, two_genes, i)
+        person[genes] += p
+        person[3] += p * weights[i][genes][0]
+        person[4] += p * weights[i][genes][1]
+
+
+def gray_code_changes(radices):
+    """
+    Lazily generate the steps of a reflected mixed-radix Gray code over
+    digits with the given `radices`, starting from all zeros. Each step
+    changes exactly one digit and is yielded as (position, new_value).
+    """
+    digits = [0] * len(radices)
+    directions = [1] * len(radices)
+    while True:
+
+        # Move the lowest digit that has not reached the end of its
+        # range, turning around every digit below it that has
+        position = 0
+        while position < len(radices):
+            value = digits[position] + directions[position]
+            if 0 <= value < radices[position]:
+                break
+            directions[position] = -directions[position]
+            position += 1
+        if position == len(radices):
+            return
+        digits[position] = value
+        yield position, value
+
+
+def log_or_none(x):
+    """
+    Return the natural log of `x`, or None if `x` is zero.
+    """
+    return math.log(x) if x > 0 else None
+
+
+def gray_code_probabilities(people, probs=None):
+    """
+    Compute gene and trait distributions for everyone in `people` by
+    brute-force enumeration, walking assignments in Gray-code order so
+    that consecutive assignments differ in one person's gene count or
+    unknown trait.
+
+    The joint probability is kept as a running sum of per-person log
+    factors, so each step only recomputes the factors of the person who
+    changed and, for a gene change, their children.
+    """
+    pedigree = Pedigree.compile(people)
+    n = len(pedigree)
+    mothers = pedigree.mothers
+    fathers = pedigree.fathers
+
+    log_prior, log_inheritance, log_trait = compile_model(probs).logs()
+
+    # Every gene count is a digit, followed by every unknown trait
+    unknown = [i for i, trait in enumerate(pedigree.traits) if trait < 0]
+    radices = [3] * n + [2] * len(unknown)
+    genes = [0] * n
+    traits = [max(trait, 0) for trait in pedigree.traits]
+
+    def log_factor(i):
+        if mothers[i] < 0:
+            gene_term = log_prior[genes[i]]
+        else:
+            gene_term = log_inheritance[genes[i]][genes[mothers[i]]][
+                genes[fathers[i]]
+            ]
+        trait_term = log_trait[genes[i]][traits[i]]
+        if gene_term is None or trait_term is None:
+            return None
+        return gene_term + trait_term
+
+    # Factors that are zero are counted rather than added, since their
+    # log is undefined and any one of them makes the product zero
+    factors = [log_factor(i) for i in range(n)]
+    log_total = math.fsum(f for f in factors if f is not None)
+    zeros = factors.count(None)
+
+    def refresh(i):
+        nonlocal log_total, zeros
+        old = factors[i]
+        new = factors[i] = log_factor(i)
+        if old is None:
+            zeros -= 1
+        else:
+            log_total -= old
+        if new is None:
+            zeros += 1
+        else:
+            log_total += new
+
+    # Only count factor evaluations when profiling, so that the plain
+    # refresh stays as cheap as possible otherwise
+    if PROFILER is not None:
+        evaluations = [1] * n
+        uncounted_refresh = refresh
+
+        def refresh(i):
+            evaluations[i] += 1
+            uncounted_refresh(i)
+
+    # Rather than adding every joint probability to everyone's totals,
+    # keep a running sum of joint probabilities and credit each person's
+    # old value with the part of it accrued since their last change.
+    # Everything is kept relative to a log scale, as in `enumerate_shard`.
+    totals = [[0] * 5 for _ in range(n)]
+    gene_since = [0.0] * n
+    trait_since = [0.0] * n
+    accrued = 0.0
+    scale = -math.inf
+
+    def rescale(new_scale):
+        nonlocal accrued, scale
+        factor = math.exp(scale - new_scale)
+        rescale_totals(totals, scale, new_scale)
+        for i in range(n):
+            gene_since[i] *= factor
+            trait_since[i] *= factor
+        accrued *= factor
+        scale = new_scale
+
+    if not zeros:
+        rescale(log_total)
+        accrued = 1.0
+
+    for position, value in gray_code_changes(radices):
+        if position < n:
+            i = position
+            totals[i][genes[i]] += accrued - gene_since[i]
+            gene_since[i] = accrued
+            genes[i] = value
+            refresh(i)
+            for child in pedigree.children[i]:
+                refresh(child)
+        else:
+            i = unknown[position - n]
+            totals[i][3 + traits[i]] += accrued - trait_since[i]
+            trait_since[i] = accrued
+            traits[i] = value
+            refresh(i)
+        if not zeros:
+            if log_total > scale + LOG_HEADROOM:
+                rescale(log_total)
+            accrued += math.exp(log_total - scale)
+
+    # Credit everyone's final values with what is left
+    for i in range(n):
+        totals[i][genes[i]] += accrued - gene_since[i]
+        totals[i][3 + traits[i]] += accrued - trait_since[i]
+
+    if PROFILER is not None:
+        PROFILER.count("assignments_enumerated", math.prod(radices))
+        PROFILER.count("assignments_skipped",
+                       3 ** n * 2 ** n - math.prod(radices))
+        for i, count in enumerate(evaluations):
+            PROFILER.count_factors(pedigree.names[i], count)
+
+    return probabilities_from_totals(pedigree, totals)
+
+
+def passing_probability(genes, mutation):
+    """
+    Return the probability that a parent with `genes` copies of the gene
+    passes a copy of it on to their child, given the `mutation` rate.
+    """
+    if genes == 2:
+        return 1 - mutation
+    if genes == 1:
+        return 0.5 * (1 - mutation) + 0.5 * mutation
+    return mutation
+
+
+def inheritance_probability(genes, mother_genes, father_genes, mutation):
+    """
+    Return the probability that a child has `genes` copies of the gene,
+    given how many copies their mother and father have and the
+    `mutation` rate.
+    """
+    mother = passing_probability(mother_genes, mutation)
+    father = passing_probability(father_genes, mutation)
+    if genes == 2:
+        return mother * father
+    if genes == 1:
+        return mother * (1 - father) + (1 - mother) * father
+    return (1 - mother) * (1 - father)
+
+
+class Model:
+    """
+    Probability tables compiled from a dictionary in the form of PROBS,
+    so that inference only ever has to look values up:
+        * `prior[genes]` is the unconditional probability of a gene count,
+        * `inheritance[genes][mother][father]` is the probability of a
+          child's gene count given their parents' gene counts, and
+        * `trait[genes][trait]` is the probability of a trait (0 or 1)
+          given a gene count.
+    `log_prior`, `log_inheritance` and `log_trait` hold their natural
+    logs, with -inf as the log of zero, so that joint probabilities can be
+    added up in log space without any checks. Other log and NumPy
+    versions of the tables are built on first use.
+    """
+
+    __slots__ = (
+        "probs", "key", "prior", "inheritance", "trait",
+        "log_prior", "log_inheritance", "log_trait",
+        "log_tables", "numpy_tables", "numpy_log_tables"
+    )
+
+    def __init__(self, probs, key):
+        self.probs = probs
+        self.key = key
+        mutation = probs["mutation"]
+        self.prior = [probs["gene"][genes] for genes in GENES]
+        self.inheritance = [
+            [
+                [inheritance_probability(genes, mother, father, mutation)
+                 for father in GENES]
+                for mother in GENES
+            ]
+            for genes in GENES
+        ]
+        self.trait = [
+            [probs["trait"][genes][False], probs["trait"][genes][True]]
+            for genes in GENES
+        ]
+
+        def log(p):
+            return math.log(p) if p > 0 else -math.inf
+
+        self.log_prior = [log(p) for p in self.prior]
+        self.log_inheritance = [
+            [[log(p) for p in row] for row in table]
+            for table in self.inheritance
+        ]
+        self.log_trait = [[log(p) for p in row] for row in self.trait]
+        self.log_tables = None
+        self.numpy_tables = None
+        self.numpy_log_tables = None
+
+    def logs(self):
+        """
+        Return the prior, inheritance and trait tables as natural logs,
+        with None in place of the log of zero.
+        """
+        if self.log_tables is None:
+            self.log_tables = (
+                [log_or_none(p) for p in self.prior],
+                [[[log_or_none(p) for p in row] for row in table]
+                 for table in self.inheritance],
+                [[log_or_none(p) for p in row] for row in self.trait]
+            )
+        return self.log_tables
+
+    def arrays(self):
+        """
+        Return the prior, inheritance and trait tables as NumPy arrays.
+        """
+        require_numpy()
+        if self.numpy_tables is None:
+            self.numpy_tables = (
+                np.array(self.prior),
+                np.array(self.inheritance),
+                np.array(self.trait)
+            )
+        return self.numpy_tables
+
+    def log_arrays(self):
+        """
+        Return the log prior, inheritance and trait tables as NumPy
+        arrays.
+        """
+        require_numpy()
+        if self.numpy_log_tables is None:
+            self.numpy_log_tables = (
+                np.array(self.log_prior),
+                np.array(self.log_inheritance),
+                np.array(self.log_trait)
+            )
+        return self.numpy_log_tables
+
+
+def compile_model(probs=None):
+    """
+    Return the compiled `Model` for `probs`, a dictionary in the form of
+    PROBS (PROBS itself by default). Models are compiled once and then
+    looked up by their parameters, so equal dictionaries share a model,
+    until they are among the least recently used of `MODEL_CACHE_SIZE`.
+    Models are returned unchanged.
+    """
+    if isinstance(probs, Model):
+        return probs
+    if probs is None:
+        probs = PROBS
+    return model_for_values(probs_values(probs))
+
+
+# Most compiled models to keep for reuse
+MODEL_CACHE_SIZE = 64
+
+
+@functools.lru_cache(maxsize=MODEL_CACHE_SIZE)
+def model_for_values(values):
+    """
+    Return a new `Model` for the parameters in `values`, a tuple as from
+    `probs_values`, hashing them only here, when it is compiled.
+    """
+    probs = {
+        "gene": dict(zip(GENES, values[:3])),
+        "trait": {
+            genes: {False: values[3 + 2 * genes], True: values[4 + 2 * genes]}
+            for genes in GENES
+        },
+        "mutation": values[9]
+    }
+    return Model(probs, probs_key(probs))
+
+
+def probs_values(probs):
+    """
+    Return every parameter in `probs` as a flat tuple of floats.
+    """
+    gene = probs["gene"]
+    trait = probs["trait"]
+    return (
+        float(gene[0]), float(gene[1]), float(gene[2]),
+        float(trait[0][False]), float(trait[0][True]),
+        float(trait[1][False]), float(trait[1][True]),
+        float(trait[2][False]), float(trait[2][True]),
+        float(probs["mutation"])
+    )
+
+
+def probs_key(probs):
+    """
+    Return a hash of the parameters in `probs` that is the same for any
+    two dictionaries holding the same values.
+    """
+    canonical = {
+        "gene": {str(genes): float(probs["gene"][genes]) for genes in GENES},
+        "trait": {
+            str(genes): [float(probs["trait"][genes][False]),
+                         float(probs["trait"][genes][True])]
+            for genes in GENES
+        },
+        "mutation": float(probs["mutation"])
+    }
+    return hashlib.sha256(
+        json.dumps(canonical, sort_keys=True).encode()
+    ).hexdigest()
+
+
+def load_probs(filename):
+    """
+    Load probabilities in the form of PROBS from a JSON or YAML file.
+    Gene counts may be written as strings and traits as true/false,
+    1/0 or strings of either, as JSON requires.
+    """
+    try:
+        return parse_probs(load_structured(filename))
+    except ValueError as e:
+        raise ValueError(f"{filename}: {e}") from e
+
+
+def load_sweep(filename, base=None):
+    """
+    Load a list of probabilities in the form of PROBS from a JSON or YAML
+    file holding a list, for `sweep_probabilities`. Each entry only needs
+    the top-level keys ("gene", "trait" or "mutation") that differ from
+    `base` (PROBS by default).
+    """
+    raw = load_structured(filename)
+    if not isinstance(raw, list):
+        raise ValueError(f"{filename} must hold a list of probabilities")
+    base = PROBS if base is None else base
+    sweep = []
+    for entry in raw:
+        if not isinstance(entry, dict):
+            raise ValueError(f"malformed probabilities: {entry!r}")
+        try:
+            sweep.append(parse_probs({**base, **entry}))
+        except ValueError as e:
+            raise ValueError(f"{filename}: {e}") from e
+    return sweep
+
+
+def load_structured(filename):
+    """
+    Return the contents of a JSON file, or a YAML file if its name ends
+    in .yaml or .yml. Raises ValueError if the file cannot be parsed.
+    """
+    with open(filename) as f:
+        if filename.endswith((".yaml", ".yml")):
+            if yaml is None:
+                raise ImportError(
+                    "PyYAML is required to load YAML files; "
+                    "install it with `pip install pyyaml`"
+                )
+            try:
+                return yaml.safe_load(f)
+            except yaml.YAMLError as e:
+                raise ValueError(f"invalid YAML: {e}") from e
+        return json.load(f)
+
+
+def parse_probs(raw):
+    """
+    Return a dictionary in the form of PROBS from `raw`, whose keys may
+    be strings, checking that every distribution is valid.
+    """
+    def trait_value(key):
+        value = str(key).lower()
+        if value in ("true", "1"):
+            return True
+        if value in ("false", "0"):
+            return False
+        raise ValueError(f"unknown trait value {key!r}")
+
+    try:
+        probs = {
+            "gene": {int(genes): float(p)
+                     for genes, p in raw["gene"].items()},
+            "trait": {
+                int(genes): {trait_value(trait): float(p)
+                             for trait, p in distribution.items()}
+                for genes, distribution in raw["trait"].items()
+            },
+            "mutation": float(raw["mutation"])
+        }
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ValueError(f"malformed probabilities: {e!r}") from e
+
+    distributions = [probs["gene"]] + [
+        probs["trait"].get(genes, {}) for genes in GENES
+    ]
+    for distribution, keys in zip(distributions,
+                                  [GENES] + [(True, False)] * 3):
+        if set(distribution) != set(keys):
+            raise ValueError(f"expected probabilities for {keys}")
+        if any(p < 0 for p in distribution.values()) or not math.isclose(
+            sum(distribution.values()), 1
+        ):
+            raise ValueError(f"{distribution} is not a distribution")
+    if not 0 <= probs["mutation"] <= 1:
+        raise ValueError("mutation must be between 0 and 1")
+    return probs
+
+
+class Factor:
+    """
+    A table over gene variables, mapping every tuple of gene counts
+    (one entry per variable, in the order of `variables`) to a value.
+    """
+
+    def __init__(self, variables, values):
+        self.variables = tuple(variables)
+        self.values = values
+
+    def multiply(self, other):
+        """
+        Return the product of this factor and `other`.
+        """
+        variables = self.variables + tuple(
+            v for v in other.variables if v not in self.variables
+        )
+        positions = [variables.index(v) for v in other.variables]
+        size = len(self.variables)
+        values = dict()
+        for assignment in itertools.product(GENES, repeat=len(variables)):
+            other_key = tuple(assignment[i] for i in positions)
+            values[assignment] = (
+                self.values[assignment[:size]] * other.values[other_key]
+            )
+        return Factor(variables, values)
+
+    def marginal(self, variables):
+        """
+        Return the factor that results from summing out everything
+        except `variables`, which must be a subset of this factor's.
+        """
+        variables = tuple(variables)
+        positions = [self.variables.index(v) for v in variables]
+        values = dict.fromkeys(
+            itertools.product(GENES, repeat=len(variables)), 0
+        )
+        for assignment, value in self.values.items():
+            values[tuple(assignment[i] for i in positions)] += value
+        return Factor(variables, values)
+
+    def divide(self, other):
+        """
+        Return this factor divided by `other`, whose variables must be a
+        subset of this factor's. Zero divided by zero is taken to be zero.
+        """
+        positions = [self.variables.index(v) for v in other.variables]
+        values = dict()
+        for assignment, value in self.values.items():
+            divisor = other.values[tuple(assignment[i] for i in positions)]
+            values[assignment] = value / divisor if divisor else 0
+        return Factor(self.variables, values)
+
+    def normalized(self, total=None):
+        """
+        Return this factor scaled so that its values sum to 1. `total` is
+        the sum of its values, if already known.
+        """
+        if total is None:
+            total = sum(self.values.values())
+        if not total:
+            return self
+        return Factor(self.variables, {
+            assignment: value / total
+            for assignment, value in self.values.items()
+        })
+
+
+def person_factor(pedigree, i, model):
+    """
+    Return the factor for person `i`'s gene count given their parents,
+    under the compiled `model`, with any known trait folded in as
+    evidence.
+    """
+    trait = pedigree.trait(i)
+
+    if pedigree.is_founder(i):
+        variables = (i,)
+        values = {(genes,): model.prior[genes] for genes in GENES}
+    elif pedigree.mothers[i] == pedigree.fathers[i]:
+        # Someone who is both mother and father passes on both copies
+        variables = (i, pedigree.mothers[i])
+        values = {
+            (genes, parent_genes):
+                model.inheritance[genes][parent_genes][parent_genes]
+            for genes, parent_genes in itertools.product(GENES, repeat=2)
+        }
+    else:
+        variables = (i, pedigree.mothers[i], pedigree.fathers[i])
+        values = {
+            (genes, mother_genes, father_genes):
+                model.inheritance[genes][mother_genes][father_genes]
+            for genes, mother_genes, father_genes
+            in itertools.product(GENES, repeat=3)
+        }
+
+    # Unknown traits are leaves of the network and sum out to 1
+    if trait is not None:
+        for assignment in values:
+            values[assignment] *= model.trait[assignment[0]][trait]
+
+    return Factor(variables, values)
+
+
+def elimination_order(pedigree):
+    """
+    Return an elimination ordering of everyone in `pedigree`, by id,
+    along with the neighbours each person has when they are eliminated.
+    Picks the person whose elimination adds the fewest fill-in edges,
+    breaking ties by fewest neighbours.
+    """
+
+    # Build the moral graph: everyone is linked to their parents,
+    # and every pair of parents is linked to each other
+    graph = {i: set() for i in range(len(pedigree))}
+    for i in pedigree.order:
+        if pedigree.is_founder(i):
+            continue
+        family = {i, pedigree.mothers[i], pedigree.fathers[i]}
+        for a, b in itertools.combinations(family, 2):
+            graph[a].add(b)
+            graph[b].add(a)
+
+    def score(person):
+        neighbours = graph[person]
+        fill = sum(
+            1 for a, b in itertools.combinations(neighbours, 2)
+            if b not in graph[a]
+        )
+        return (fill, len(neighbours))
+
+    # Scores only change near an eliminated person, so keep stale
+    # heap entries around and skip them when they are popped
+    scores = {person: score(person) for person in graph}
+    heap = [(scores[person], person) for person in graph]
+    heapq.heapify(heap)
+
+    order = []
+    neighbourhoods = dict()
+    while heap:
+        person_score, person = heapq.heappop(heap)
+        if person not in graph or scores[person] != person_score:
+            continue
+
+        # Connect the remaining neighbours and remove the person
+        neighbours = graph.pop(person)
+        for a, b in itertools.combinations(neighbours, 2):
+            graph[a].add(b)
+            graph[b].add(a)
+        for neighbour in neighbours:
+            graph[neighbour].discard(person)
+        order.append(person)
+        neighbourhoods[person] = neighbours
+        del scores[person]
+
+        # Rescore everyone whose neighbourhood may have changed
+        affected = set(neighbours)
+        for neighbour in neighbours:
+            affected |= graph[neighbour]
+        for other in affected:
+            scores[other] = score(other)
+            heapq.heappush(heap, (scores[other], other))
+
+    return order, neighbourhoods
+
+
+class CliqueTree:
+    """
+    A tree of cliques for exact inference on a pedigree, one clique per
+    person, built from an elimination ordering. Messages between cliques
+    and each person's marginals are cached, so a tree can answer many
+    queries and take new trait observations without starting over.
+
+    Observing a trait only changes the potential of one clique, so only
+    the messages flowing away from it go stale. They are recomputed when
+    a later query needs them, along the path from that clique to the
+    clique being queried.
+    """
+
+    def __init__(self, people, probs=None):
+        self.pedigree = Pedigree.compile(people)
+        self.model = compile_model(probs)
+        self.shared = self.pedigree is people
+        lap = phase_timer()
+        self.order, neighbourhoods = elimination_order(self.pedigree)
+        position = {person: i for i, person in enumerate(self.order)}
+        lap("elimination_order")
+
+        # Each clique's parent is the clique of the first neighbour to be
+        # eliminated after it; cliques without neighbours are roots
+        self.cliques = {
+            person: (person,) + tuple(
+                sorted(neighbourhoods[person], key=position.get)
+            )
+            for person in self.order
+        }
+        self.parent = {
+            person: self.cliques[person][1]
+            if len(self.cliques[person]) > 1 else None
+            for person in self.order
+        }
+        self.children = {person: [] for person in self.order}
+        for person in self.order:
+            if self.parent[person] is not None:
+                self.children[self.parent[person]].append(person)
+
+        # Give each factor to the clique of the first person in its scope
+        # to be eliminated, which is guaranteed to contain the whole scope
+        self.owner = dict()
+        self.assigned = {person: [] for person in self.order}
+        for person in self.order:
+            scope = (person,) if self.pedigree.is_founder(person) else (
+                person, self.pedigree.mothers[person],
+                self.pedigree.fathers[person]
+            )
+            self.owner[person] = min(scope, key=position.get)
+            self.assigned[self.owner[person]].append(person)
+        self.potentials = {
+            person: self.potential(person) for person in self.order
+        }
+        lap("factors")
+        if PROFILER is not None:
+            for name in self.pedigree.names:
+                PROFILER.count_factors(name)
+
+        # Messages are keyed by (from clique, to clique)
+        self.messages = dict()
+        self.marginals = dict()
+        self.log_likelihood = None
+
+    def potential(self, clique):
+        """
+        Return the product of the factors assigned to `clique`.
+        """
+        potential = Factor(self.cliques[clique], dict.fromkeys(
+            itertools.product(GENES, repeat=len(self.cliques[clique])), 1
+        ))
+        for person in self.assigned[clique]:
+            potential = potential.multiply(
+                person_factor(self.pedigree, person, self.model)
+            )
+        return potential
+
+    def neighbours(self, clique):
+        """
+        Return the cliques adjacent to `clique` in the tree.
+        """
+        if self.parent[clique] is None:
+            return self.children[clique]
+        return self.children[clique] + [self.parent[clique]]
+
+    def separator(self, source, target):
+        """
+        Return the variables shared by adjacent cliques `source` and
+        `target`: everything in the child's clique but the child.
+        """
+        child = target if self.parent[target] == source else source
+        return self.cliques[child][1:]
+
+    def belief(self, clique, exclude=None):
+        """
+        Return the potential of `clique` times every cached message into
+        it, except the one from `exclude`. Products are normalized as
+        they go so large pedigrees do not underflow.
+        """
+        belief = self.potentials[clique]
+        for neighbour in self.neighbours(clique):
+            if neighbour != exclude:
+                belief = belief.multiply(
+                    self.messages[(neighbour, clique)]
+                ).normalized()
+        return belief
+
+    def calibrate(self):
+        """
+        Compute every message and marginal with one pass up the tree,
+        from leaves to roots, and one pass back down. Also sets
+        `log_likelihood` to the log probability of the known traits.
+        """
+        lap = phase_timer()
+        log_likelihood = 0.0
+
+        def normalized(factor):
+            # What normalizing divides out multiplies up to the
+            # probability of the known traits
+            nonlocal log_likelihood
+            total = sum(factor.values.values())
+            log_likelihood += math.log(total) if total else -math.inf
+            return factor.normalized(total)
+
+        beliefs = dict()
+        for person in self.order:
+            belief = self.potentials[person]
+            for child in self.children[person]:
+                belief = normalized(
+                    belief.multiply(self.messages[(child, person)])
+                )
+            beliefs[person] = belief
+            if self.parent[person] is not None:
+                self.messages[(person, self.parent[person])] = normalized(
+                    belief.marginal(self.cliques[person][1:])
+                )
+            else:
+                normalized(belief)
+        self.log_likelihood = log_likelihood
+
+        # Pass back down, from roots to leaves. Dividing a clique's own
+        # upward message out of its parent's belief leaves the message
+        # the parent sends it.
+        for person in reversed(self.order):
+            parent = self.parent[person]
+            if parent is not None:
+                downward = beliefs[parent].marginal(self.cliques[person][1:])
+                downward = downward.divide(
+                    self.messages[(person, parent)]
+                ).normalized()
+                self.messages[(parent, person)] = downward
+                beliefs[person] = beliefs[person].multiply(downward)
+            gene = beliefs[person].marginal((person,)).normalized()
+            self.marginals[person] = {
+                genes: gene.values[(genes,)] for genes in GENES
+            }
+        lap("message_passing")
+
+    def collect(self, clique):
+        """
+        Compute any missing messages into `clique`, working inwards from
+        the furthest cliques that need them.
+        """
+        stack = [
+            (neighbour, clique) for neighbour in self.neighbours(clique)
+        ]
+        needed = []
+        while stack:
+            source, target = stack.pop()
+            if (source, target) in self.messages:
+                continue
+            needed.append((source, target))
+            stack.extend(
+                (neighbour, source) for neighbour in self.neighbours(source)
+                if neighbour != target
+            )
+        for source, target in reversed(needed):
+            self.messages[(source, target)] = self.belief(
+                source, target
+            ).marginal(self.separator(source, target)).normalized()
+
+    def gene_distribution(self, person):
+        """
+        Return the distribution of gene counts for person `person` as a
+        dictionary from count to probability.
+        """
+        if person not in self.marginals:
+            self.collect(person)
+            gene = self.belief(person).marginal((person,)).normalized()
+            self.marginals[person] = {
+                genes: gene.values[(genes,)] for genes in GENES
+            }
+        return self.marginals[person]
+
+    def observe(self, name, trait):
+        """
+        Record `trait` (True, False or None to forget it) as the known
+        trait of the person called `name`, invalidating only the cached
+        messages and marginals it affects.
+        """
+        if name not in self.pedigree:
+            raise ValueError(f"{name} is not in the pedigree")
+        person = self.pedigree.ids[name]
+        if self.pedigree.trait(person) == trait:
+            return
+
+        # Never change a pedigree the caller passed in
+        if self.shared:
+            self.pedigree = self.pedigree.subset(range(len(self.pedigree)))
+            self.shared = False
+        self.pedigree.traits[person] = -1 if trait is None else int(trait)
+        clique = self.owner[person]
+        self.potentials[clique] = self.potential(clique)
+
+        # Every message pointing away from the changed clique is stale,
+        # as is every marginal in the same tree
+        stack = [(clique, None)]
+        while stack:
+            source, previous = stack.pop()
+            self.marginals.pop(source, None)
+            for neighbour in self.neighbours(source):
+                if neighbour != previous:
+                    self.messages.pop((source, neighbour), None)
+                    stack.append((neighbour, source))
+
+    def probabilities(self, names=None):
+        """
+        Return gene and trait distributions for the people in `names`
+        (default everyone), in the same form as `enumerate_probabilities`.
+        """
+        pedigree = self.pedigree
+        names = pedigree.names if names is None else names
+        probabilities = empty_probabilities(names)
+        for name in names:
+            person = pedigree.ids[name]
+            gene = self.gene_distribution(person)
+            for genes in GENES:
+                probabilities[name]["gene"][genes] = gene[genes]
+
+            trait = pedigree.trait(person)
+            for value in (True, False):
+                if trait is None:
+                    probabilities[name]["trait"][value] = sum(
+                        gene[genes] * self.model.trait[genes][value]
+                        for genes in GENES
+                    )
+                else:
+                    probabilities[name]["trait"][value] = float(
+                        trait == value
+                    )
+        return probabilities
+
+
+def infer(people, probs=None):
+    """
+    Compute exact gene and trait distributions for everyone in `people`
+    by variable elimination, returning them in the same form as
+    `enumerate_probabilities`.
+
+    The elimination ordering defines a tree of cliques, one per person,
+    and two passes of messages over that tree give every person's
+    marginal at once. Cost grows with the treewidth of the pedigree
+    rather than exponentially with the number of people.
+    """
+    tree = CliqueTree(people, probs)
+    tree.calibrate()
+    return tree.probabilities()
+
+
+def top_configurations(people, k=1, probs=None):
+    """
+    Return the `k` most probable assignments of genes and traits to
+    everyone in `people` that agree with the known traits, most probable
+    first, as ((one_gene, two_genes, have_trait), log_probability) pairs
+    with the same sets as `joint_probability` and the natural log of the
+    joint probability, which for large pedigrees is too small to hold as
+    is.
+
+    Max-product elimination along the same ordering as `infer` gives,
+    for any assignment of the people eliminated last, the log probability
+    of its best completion. People are then assigned in reverse order by
+    a depth-first branch-and-bound search that uses this as an exact
+    upper bound, so it only leaves the best path to explore branches
+    that can still beat the k-th best assignment found so far.
+    """
+    pedigree = Pedigree.compile(people)
+    model = compile_model(probs)
+    n = len(pedigree)
+    order, neighbourhoods = elimination_order(pedigree)
+    position = {person: i for i, person in enumerate(order)}
+
+    # Each person's log factor, with an unknown trait maximized out
+    best_trait = [max(row) for row in model.log_trait]
+    buckets = {person: [] for person in order}
+    for i in range(n):
+        trait = pedigree.traits[i]
+        if pedigree.is_founder(i):
+            scope = (i,)
+            table = {(genes,): model.log_prior[genes] for genes in GENES}
+        elif pedigree.mothers[i] == pedigree.fathers[i]:
+            scope = (i, pedigree.mothers[i])
+            table = {
+                (genes, parent):
+                    model.log_inheritance[genes][parent][parent]
+                for genes, parent in itertools.product(GENES, repeat=2)
+            }
+        else:
+            scope = (i, pedigree.mothers[i], pedigree.fathers[i])
+            table = {
+                (genes, mother, father):
+                    model.log_inheritance[genes][mother][father]
+                for genes, mother, father in itertools.product(GENES,
+                                                               repeat=3)
+            }
+        for assignment in table:
+            genes = assignment[0]
+            table[assignment] += (best_trait[genes] if trait < 0 else
+                                  model.log_trait[genes][trait])
+        buckets[min(scope, key=position.get)].append((scope, table))
+
+    # Eliminate everyone in turn, keeping each bucket's combined table
+    # and the message it sends, which maximizes its person out
+    cliques = dict()
+    combined = dict()
+    messages = dict()
+    for person in order:
+        clique = (person,) + tuple(
+            sorted(neighbourhoods[person], key=position.get)
+        )
+        table = dict.fromkeys(
+            itertools.product(GENES, repeat=len(clique)), 0.0
+        )
+        for scope, factor in buckets[person]:
+            key = operator.itemgetter(*[clique.index(v) for v in scope])
+            if len(scope) == 1:
+                factor = {genes[0]: value for genes, value in factor.items()}
+            for assignment in table:
+                table[assignment] += factor[key(assignment)]
+        message = dict()
+        for rest in itertools.product(GENES, repeat=len(clique) - 1):
+            message[rest] = max(table[(genes,) + rest] for genes in GENES)
+        cliques[person] = clique
+        combined[person] = table
+        messages[person] = message
+        if len(clique) > 1:
+            buckets[clique[1]].append((clique[1:], message))
+
+    # Search people in reverse elimination order, each followed by their
+    # trait if unknown, starting from the best log probability overall
+    steps = []
+    for person in reversed(order):
+        steps.append((person, False))
+        if pedigree.traits[person] < 0:
+            steps.append((person, True))
+    root = sum(
+        messages[person][()] for person in order if len(cliques[person]) == 1
+    )
+    genes = [0] * n
+    traits = [max(trait, 0) for trait in pedigree.traits]
+    best = []
+    threshold = -math.inf
+    count = 0
+
+    # Bounds are updated a step at a time, so allow for rounding in
+    # proportion to their size when comparing them, and treat branches
+    # tied with the k-th best as unable to beat it
+    tolerance = 1e-9 * max(1.0, abs(root))
+
+    # Stack entries set one step's value, the last person or trait
+    # assigned, and hold the best log probability still reachable
+    stack = [(root, 0, None)]
+    while stack:
+        bound, depth, value = stack.pop()
+
+        # Ignore branches that cannot beat the k-th best
+        if bound <= threshold + tolerance or bound == -math.inf:
+            continue
+        if depth:
+            person, is_trait = steps[depth - 1]
+            if is_trait:
+                traits[person] = value
+            else:
+                genes[person] = value
+
+        if depth == len(steps):
+            heapq.heappush(best, (bound, count, genes[:], traits[:]))
+            count += 1
+            if len(best) > k:
+                heapq.heappop(best)
+            if len(best) == k:
+                threshold = best[0][0]
+            continue
+
+        # Swap the bound's estimate for this step for each actual value
+        person, is_trait = steps[depth]
+        if is_trait:
+            log_trait = model.log_trait[genes[person]]
+            children = [
+                (bound - best_trait[genes[person]] + log_trait[trait], trait)
+                for trait in (0, 1)
+            ]
+        else:
+            rest = tuple(genes[v] for v in cliques[person][1:])
+            table = combined[person]
+            message = messages[person][rest]
+            children = [
+                (bound - message + table[(value,) + rest], value)
+                for value in GENES
+            ]
+        for child_bound, value in sorted(children):
+            if child_bound > threshold + tolerance:
+                stack.append((child_bound, depth + 1, value))
+
+    configurations = []
+    for log_probability, _, genes, traits in sorted(best, reverse=True):
+        names = pedigree.names
+        configurations.append((
+            (
+                {names[i] for i in range(n) if genes[i] == 1},
+                {names[i] for i in range(n) if genes[i] == 2},
+                {names[i] for i in range(n) if traits[i]}
+            ),
+            log_probability
+        ))
+    return configurations
+
+
+def require_numpy():
+    """
+    Raise an error explaining how to proceed if NumPy is not installed.
+    """
+    if np is None:
+        raise ImportError(
+            "NumPy is required for vectorized inference; "
+            "install it with `pip install numpy`"
+        )
+
+
+def parent_indices(pedigree):
+    """
+    Return integer arrays of each person's mother and father id in
+    `pedigree`, and a boolean array marking people without parents.
+    Founders point at themselves so the arrays can be used for lookups.
+    """
+    founders = np.asarray(pedigree.mothers) < 0
+    ids = np.arange(len(pedigree))
+    mothers = np.where(founders, ids, pedigree.mothers)
+    fathers = np.where(founders, ids, pedigree.fathers)
+    return mothers, fathers, founders
+
+
+def batch_log_joint_probability(pedigree, genes, traits, probs=None):
+    """
+    Compute the natural log of the joint probability of many assignments
+    at once, by adding up log factors looked up in precomputed tables.
+    Impossible assignments get -inf.
+
+    `genes` and `traits` are integer arrays with one row per assignment
+    and one column per person in `pedigree`, holding gene counts and
+    traits (0 or 1) respectively. Returns an array with one log joint
+    probability per row, matching what `joint_probability` computes.
+    """
+    prior, inheritance, trait = compile_model(probs).log_arrays()
+    mothers, fathers, founders = parent_indices(pedigree)
+
+    gene_terms = np.where(
+        founders,
+        prior[genes],
+        inheritance[genes, genes[:, mothers], genes[:, fathers]]
+    )
+    return (gene_terms + trait[genes, traits]).sum(axis=1)
+
+
+def vectorized_probabilities(people, chunk_size=2 ** 16, probs=None):
+    """
+    Compute gene and trait distributions for everyone in `people` by
+    evaluating every assignment consistent with the known traits in
+    batches of `chunk_size` rows, so memory stays bounded.
+
+    Joint probabilities are computed as logs and added up relative to a
+    running log scale, as in `enumerate_shard`, so large pedigrees do
+    not underflow.
+    """
+    require_numpy()
+    pedigree = Pedigree.compile(people)
+    n = len(pedigree)
+
+    # Every assignment is a number whose low base-3 digits are gene
+    # counts and whose remaining binary digits are the unknown traits
+    traits = np.asarray(pedigree.traits, dtype=np.int64)
+    unknown = np.flatnonzero(traits < 0)
+    known = np.maximum(traits, 0)
+    gene_places = 3 ** np.arange(n, dtype=np.int64)
+    trait_places = 2 ** np.arange(len(unknown), dtype=np.int64)
+    total = 3 ** n * 2 ** len(unknown)
+
+    gene_totals = np.zeros(3 * n)
+    trait_totals = np.zeros(2 * n)
+    scale = -np.inf
+    gene_offsets = 3 * np.arange(n)
+    trait_offsets = 2 * np.arange(n)
+    for start in range(0, total, chunk_size):
+        codes = np.arange(start, min(start + chunk_size, total),
+                          dtype=np.int64)
+        genes = (codes[:, None] // gene_places) % 3
+        traits = np.tile(known, (len(codes), 1))
+        traits[:, unknown] = (codes[:, None] // 3 ** n // trait_places) % 2
+
+        # Weight every person's gene and trait value by the joint
+        # probability of the row it appears in
+        with timed("batch_log_joint_probability"):
+            log_p = batch_log_joint_probability(pedigree, genes, traits,
+                                                probs)
+        chunk_scale = log_p.max()
+        if chunk_scale == -np.inf:
+            continue
+        if chunk_scale > scale + LOG_HEADROOM:
+            factor = np.exp(scale - chunk_scale)
+            gene_totals *= factor
+            trait_totals *= factor
+            scale = chunk_scale
+        weights = np.repeat(np.exp(log_p - scale), n)
+        gene_totals += np.bincount((genes + gene_offsets).ravel(),
+                                   weights=weights, minlength=3 * n)
+        trait_totals += np.bincount((traits + trait_offsets).ravel(),
+                                    weights=weights, minlength=2 * n)
+
+    if PROFILER is not None:
+        PROFILER.count("assignments_enumerated", total)
+        PROFILER.count("assignments_skipped", 3 ** n * 2 ** n - total)
+        for name in pedigree.names:
+            PROFILER.count_factors(name, total)
+
+    totals = np.hstack([gene_totals.reshape(n, 3),
+                        trait_totals.reshape(n, 2)])
+    return probabilities_from_totals(pedigree, totals)
+
+
+def sweep_probabilities(people, sweep, chunk_size=None):
+    """
+    Compute gene and trait distributions for everyone in `people` under
+    every set of probabilities in `sweep`, a list of dictionaries in the
+    form of PROBS, returning a list of `probabilities` dictionaries in
+    the same order.
+
+    Only gene assignments are enumerated, with unknown traits summed out
+    as for pruned enumeration. Each assignment is described once by how
+    many times it uses each entry of the prior, inheritance and trait
+    tables, so its log joint probability under every set is one matrix
+    product of those counts with the sets' log tables. Assignments are
+    evaluated in batches of `chunk_size`, by default small enough to keep
+    each batch's joint probabilities to a few million numbers.
+
+    Every probability is NaN for any set under which the known traits
+    are impossible.
+    """
+    require_numpy()
+    pedigree = Pedigree.compile(people)
+    models = [compile_model(probs) for probs in sweep]
+    n = len(pedigree)
+    if chunk_size is None:
+        chunk_size = max(256, 2 ** 22 // max(len(models), 1))
+
+    # One column of log table entries per set: 3 priors, then 27
+    # inheritance entries, then 6 trait entries. Zero probabilities get a
+    # log so small that any assignment using one sums out to nothing,
+    # since multiplying an unused -inf by a count of zero is undefined.
+    floor = -1e100
+    logs = np.array([
+        np.concatenate([prior, inheritance.ravel(), trait.ravel()])
+        for prior, inheritance, trait
+        in (model.log_arrays() for model in models)
+    ]).reshape(len(models), 36).T
+    logs = np.maximum(logs, floor)
+    trait_tables = np.array([model.trait for model in models])
+
+    mothers, fathers, founders = parent_indices(pedigree)
+    traits = np.asarray(pedigree.traits, dtype=np.int64)
+    known = np.flatnonzero(traits >= 0)
+    gene_places = 3 ** np.arange(n, dtype=np.int64)
+    total = 3 ** n
+
+    gene_totals = np.zeros((3 * n, len(models)))
+    scale = np.full(len(models), -np.inf)
+    for start in range(0, total, chunk_size):
+        codes = np.arange(start, min(start + chunk_size, total),
+                          dtype=np.int64)
+        genes = (codes[:, None] // gene_places) % 3
+        rows = len(codes)
+
+        # Count each assignment's uses of every table entry
+        gene_entries = np.where(
+            founders,
+            genes,
+            3 + 9 * genes + 3 * genes[:, mothers] + genes[:, fathers]
+        )
+        trait_entries = 30 + 2 * genes[:, known] + traits[known]
+        offsets = 36 * np.arange(rows)[:, None]
+        counts = np.bincount(
+            np.concatenate([(gene_entries + offsets).ravel(),
+                            (trait_entries + offsets).ravel()]),
+            minlength=36 * rows
+        ).reshape(rows, 36)
+
+        # Add up joint probabilities relative to a log scale for each
+        # set, as in `vectorized_probabilities`
+        with timed("sweep_log_joint_probability"):
+            log_p = counts @ logs
+        chunk_scale = log_p.max(axis=0)
+        moved = chunk_scale > scale + LOG_HEADROOM
+        if moved.any():
+            gene_totals[:, moved] *= np.exp(scale[moved] -
+                                            chunk_scale[moved])
+            scale[moved] = chunk_scale[moved]
+        weights = np.exp(log_p - scale)
+        one_hot = (genes[:, :, None] == np.arange(3)).reshape(rows, 3 * n)
+        gene_totals += one_hot.T @ weights
+
+    if PROFILER is not None:
+        PROFILER.count("assignments_enumerated", total * len(models))
+
+    # Unknown traits follow from each gene count's chance of the trait
+    gene_totals = gene_totals.reshape(n, 3, len(models))
+    trait_totals = np.einsum("igk,kgt->ikt", gene_totals, trait_tables)
+    for i in known:
+        trait_totals[i] = 0
+        trait_totals[i, :, traits[i]] = gene_totals[i].sum(axis=0)
+
+    # If even the likeliest assignment used a zero probability, there
+    # are no possible assignments to normalize over
+    impossible = scale <= floor
+    results = []
+    for k in range(len(models)):
+        if impossible[k]:
+            probabilities = empty_probabilities(pedigree)
+            for person in probabilities.values():
+                for distribution in person.values():
+                    for value in distribution:
+                        distribution[value] = math.nan
+        else:
+            probabilities = probabilities_from_totals(pedigree, np.hstack([
+                gene_totals[:, :, k], trait_totals[:, k, :]
+            ]))
+        results.append(probabilities)
+    return results
+
+
+def gibbs_sample(people, samples=100000, time_budget=None, tolerance=None,
+                 chains=256, burn_in=100, seed=None, probs=None):
+    """
+    Estimate gene and trait distributions for everyone in `people` by
+    Gibbs sampling, running `chains` independent chains side by side as
+    NumPy arrays.
+
+    Sampling stops once `samples` draws (summed over all chains) have
+    been taken after `burn_in` sweeps, once `time_budget` seconds have
+    passed, or once every standard error is at most `tolerance`,
+    whichever comes first. The time budget covers the whole run: burn-in
+    is cut short once it has used half of it, and at least one sweep is
+    always kept. Returns `probabilities` along with standard errors in
+    the same form, estimated from the spread between chains.
+
+    Gene estimates average each person's conditional distribution given
+    everyone else rather than counting sampled values, which lowers
+    their variance. Chains cannot move between assignments separated by
+    zero-probability ones, so models without mutation may not mix.
+    """
+    require_numpy()
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+
+    pedigree = Pedigree.compile(people)
+    n = len(pedigree)
+    mothers = pedigree.mothers
+    fathers = pedigree.fathers
+    prior, inheritance, trait = compile_model(probs).arrays()
+    with np.errstate(divide="ignore"):
+        log_prior = np.log(prior)
+        log_inheritance = np.log(inheritance)
+        log_trait = np.log(trait)
+
+    # Each person's conditional depends on their own factor, their known
+    # trait and the factor of each of their children
+    evidence = [
+        None if trait < 0 else log_trait[:, trait]
+        for trait in pedigree.traits
+    ]
+
+    def draw(distributions):
+        cumulative = distributions.cumsum(axis=1)
+        u = rng.random(chains)[:, None] * cumulative[:, -1:]
+        return (u > cumulative[:, :-1]).sum(axis=1)
+
+    # Start every chain from a forward sample of the pedigree
+    genes = np.zeros((chains, n), dtype=np.int64)
+    for i in pedigree.order:
+        if pedigree.is_founder(i):
+            distributions = np.broadcast_to(prior, (chains, 3))
+        else:
+            distributions = inheritance[
+                :, genes[:, mothers[i]], genes[:, fathers[i]]
+            ].T
+        genes[:, i] = draw(distributions)
+
+    def sweep():
+        conditionals = np.empty((chains, n, 3))
+        for i in pedigree.order:
+            if pedigree.is_founder(i):
+                log_p = np.broadcast_to(log_prior, (chains, 3)).copy()
+            else:
+                log_p = log_inheritance[
+                    :, genes[:, mothers[i]], genes[:, fathers[i]]
+                ].T
+            if evidence[i] is not None:
+                log_p += evidence[i]
+            for child in pedigree.children[i]:
+                child_genes = genes[:, child]
+                if mothers[child] == fathers[child]:
+                    log_p += log_inheritance[
+                        child_genes[:, None], GENES, GENES
+                    ]
+                    continue
+                if mothers[child] == i:
+                    log_p += log_inheritance[
+                        child_genes, :, genes[:, fathers[child]]
+                    ]
+                if fathers[child] == i:
+                    log_p += log_inheritance[
+                        child_genes, genes[:, mothers[child]], :
+                    ]
+            p = np.exp(log_p - log_p.max(axis=1, keepdims=True))
+            p /= p.sum(axis=1, keepdims=True)
+            conditionals[:, i] = p
+            genes[:, i] = draw(p)
+        return conditionals
+
+    # Leave at least half of any time budget for the sweeps kept
+    burned = 0
+    while burned < burn_in:
+        if time_budget is not None and (
+            time.perf_counter() - start >= time_budget / 2
+        ):
+            break
+        sweep()
+        burned += 1
+
+    # Keep per-chain sums so chains can be compared as independent runs
+    sums = np.zeros((chains, n, 3))
+    sweeps = 0
+    while True:
+        sums += sweep()
+        sweeps += 1
+        if sweeps * chains >= samples:
+            break
+        if time_budget is not None and (
+            time.perf_counter() - start >= time_budget
+        ):
+            break
+        if tolerance is not None and sweeps % 10 == 0:
+            if chain_errors(sums / sweeps).max() <= tolerance:
+                break
+
+    if PROFILER is not None:
+        PROFILER.count("sweeps", burned + sweeps)
+        PROFILER.count("draws", sweeps * chains)
+        for i, name in enumerate(pedigree.names):
+            PROFILER.count_factors(
+                name,
+                (burned + sweeps) * chains * (1 + len(pedigree.children[i]))
+            )
+
+    chain_genes = sums / sweeps
+    chain_traits = np.empty((chains, n, 2))
+    for i, known in enumerate(pedigree.traits):
+        if known < 0:
+            chain_traits[:, i] = chain_genes[:, i] @ trait
+        else:
+            chain_traits[:, i] = 0
+            chain_traits[:, i, known] = 1
+
+    estimates = np.concatenate([chain_genes, chain_traits], axis=2)
+    probabilities = probabilities_from_totals(
+        pedigree, estimates.mean(axis=0)
+    )
+    standard_errors = probabilities_from_totals(
+        pedigree, chain_errors(estimates), normalized=False
+    )
+    return probabilities, standard_errors
+
+
+def sample_probabilities(people, **options):
+    """
+    Estimate gene and trait distributions for everyone in `people` with
+    `gibbs_sample`, discarding the standard errors.
+    """
+    return gibbs_sample(people, **options)[0]
+
+
+def chain_errors(estimates):
+    """
+    Return the standard error of the mean of `estimates` over its first
+    axis, which holds one estimate per independent chain.
+    """
+    if len(estimates) < 2:
+        return np.full(estimates.shape[1:], np.inf)
+    return estimates.std(axis=0, ddof=1) / np.sqrt(len(estimates))
+
+
+class Profiler:
+    """
+    Collects counts, timings and per-person factor evaluation counts
+    from inference while it is the active profiler (see `profiling`).
+    """
+
+    def __init__(self):
+        self.counts = collections.Counter()
+        self.seconds = collections.defaultdict(float)
+        self.factor_evaluations = collections.Counter()
+        self.extra = dict()
+
+    def count(self, name, n=1):
+        """
+        Add `n` to the count called `name`.
+        """
+        self.counts[name] += n
+
+    def count_factors(self, person, n=1):
+        """
+        Record `n` evaluations of `person`'s factor.
+        """
+        self.factor_evaluations[person] += n
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """
+        Add the time spent inside this context to the timing `name`.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+
+    def report(self):
+        """
+        Return everything collected as a dictionary ready for JSON.
+        """
+        return {
+            "counts": dict(self.counts),
+            "seconds": dict(self.seconds),
+            "factor_evaluations": dict(self.factor_evaluations),
+            **self.extra
+        }
+
+
+# The active profiler, if any. Inference checks this once per call, or
+# picks an instrumented version of its inner loop, so it costs nearly
+# nothing when profiling is off.
+PROFILER = None
+
+
+@contextlib.contextmanager
+def profiling(cprofile=False, memory=False):
+    """
+    Profile all inference run inside this context, yielding the
+    `Profiler` that collects the results. With `cprofile`, the slowest
+    functions are added to its report, and with `memory`, the peak
+    memory traced by tracemalloc. Peak resident memory of the process is
+    always reported where the platform supports it.
+
+    Only the current process is profiled, so work done by --workers
+    processes shows up in timings but not in counts.
+    """
+    global PROFILER
+    profiler = Profiler()
+    previous = PROFILER
+    PROFILER = profiler
+    if memory:
+        tracemalloc.start()
+    if cprofile:
+        cprofiler = cProfile.Profile()
+        cprofiler.enable()
+    start = time.perf_counter()
+    try:
+        yield profiler
+    finally:
+        profiler.extra["wall_seconds"] = time.perf_counter() - start
+        PROFILER = previous
+        if cprofile:
+            cprofiler.disable()
+            profiler.extra["cprofile"] = slowest_functions(cprofiler)
+        if memory:
+            profiler.extra["tracemalloc_peak_bytes"] = (
+                tracemalloc.get_traced_memory()[1]
+            )
+            tracemalloc.stop()
+        if resource is not None:
+            # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            if sys.platform != "darwin":
+                peak *= 1024
+            profiler.extra["peak_rss_bytes"] = peak
+
+
+def slowest_functions(cprofiler, limit=25):
+    """
+    Return the `limit` functions with the most time spent in them
+    (excluding callees) from a finished `cProfile.Profile`.
+    """
+    stats = pstats.Stats(cprofiler).stats
+    rows = [
+        {
+            "function": f"{filename}:{line}({function})",
+            "calls": calls,
+            "tottime": tottime,
+            "cumtime": cumtime
+        }
+        for (filename, line, function), (_, calls, tottime, cumtime, _)
+        in stats.items()
+    ]
+    rows.sort(key=lambda row: row["tottime"], reverse=True)
+    return rows[:limit]
+
+
+def timed(name):
+    """
+    Return a context manager that adds its duration to the active
+    profiler's timing `name`, or that does nothing if not profiling.
+    """
+    if PROFILER is None:
+        return contextlib.nullcontext()
+    return PROFILER.timer(name)
+
+
+def phase_timer():
+    """
+    Return a function that, when called with a name, adds the time since
+    it was last called (or created) to the active profiler's timing of
+    that name. Does nothing if not profiling.
+    """
+    if PROFILER is None:
+        return lambda name: None
+    profiler = PROFILER
+    last = time.perf_counter()
+
+    def lap(name):
+        nonlocal last
+        now = time.perf_counter()
+        profiler.seconds[name] += now - last
+        last = now
+    return lap
+
+
+def profiled_enumerate_shard(pedigree, model, one_genes=None, prune=False):
+    """
+    Do the same as `enumerate_shard`, recording in the active profiler
+    how many assignments are enumerated and skipped for contradicting
+    known traits, and the time spent generating assignments, computing
+    their joint probabilities and adding them to the totals.
+    """
+    profiler = PROFILER
+    n = len(pedigree)
+    if one_genes is None:
+        one_genes = range(1 << n)
+    totals = [[0] * 5 for _ in pedigree]
+    scale = -math.inf
+    seconds = profiler.seconds
+    clock = time.perf_counter
+
+    if prune:
+        evidence, weights = trait_tables(pedigree, model)
+        assignments = mask_genotypes(n, one_genes)
+        names = ("mask_genotypes", "mask_log_evidence_probability",
+                 "mask_update_summed")
+
+        def evaluate(one_gene, two_genes):
+            return mask_log_evidence_probability(
+                pedigree, model, evidence, one_gene, two_genes
+            )
+
+        def add(p, one_gene, two_genes):
+            mask_update_summed(totals, weights, one_gene, two_genes, p)
+    else:
+        assignments = mask_assignments(pedigree, one_genes)
+        names = ("mask_assignments", "mask_log_joint_probability",
+                 "mask_update")
+
+        def evaluate(one_gene, two_genes, have_trait):
+            return mask_log_joint_probability(
+                pedigree, model, one_gene, two_genes, have_trait
+            )
+
+        def add(p, one_gene, two_genes, have_trait):
+            mask_update(totals, one_gene, two_genes, have_trait, p)
+
+    enumerated = 0
+    while True:
+        start = clock()
+        assignment = next(assignments, None)
+        generated = clock()
+        if assignment is None:
+            seconds[names[0]] += generated - start
+            break
+        log_p = evaluate(*assignment)
+        evaluated = clock()
+        if log_p > scale + LOG_HEADROOM:
+            scale = rescale_totals(totals, scale, log_p)
+        if log_p > -math.inf:
+            add(math.exp(log_p - scale), *assignment)
+        updated = clock()
+        seconds[names[0]] += generated - start
+        seconds[names[1]] += evaluated - generated
+        seconds[names[2]] += updated - evaluated
+        enumerated += 1
+
+    # Every trait mask rejected by the evidence check skips as many
+    # assignments as each accepted one goes through; pruning never
+    # generates trait masks at all
+    known = sum(1 for trait in pedigree.traits if trait >= 0)
+    per_trait_mask = sum(1 << (n - bin(one_gene).count("1"))
+                         for one_gene in one_genes)
+    profiler.count("assignments_enumerated", enumerated)
+    if not prune:
+        profiler.count("assignments_skipped",
+                       ((1 << n) - (1 << (n - known))) * per_trait_mask)
+    for name in pedigree.names:
+        profiler.count_factors(name, enumerated)
+    return totals, scale
+
+
+# Inference engines selectable from the command line
+ENGINES = {
+    "exact": infer,
+    "enumerate": enumerate_probabilities,
+    "pruned": functools.partial(enumerate_probabilities, prune=True),
+    "gray": gray_code_probabilities,
+    "gibbs": sample_probabilities,
+    "vectorized": vectorized_probabilities,
+}
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,367 @@
+import argparse
+import collections
+import csv
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from heredity import CliqueTree, PROBS, load_data, load_probs
+
+# Rough cost in bytes of one cached table entry and of one person,
+# used to keep compiled pedigrees within the memory limit
+ENTRY_BYTES = 150
+PERSON_BYTES = 800
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        usage="python service.py [options]",
+        description="Serve exact inference over HTTP. Pedigrees are "
+                    "loaded once and kept compiled, so repeat queries "
+                    "are answered from cache and new observations only "
+                    "recompute what they affect."
+    )
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765,
+                        help="port to listen on (default: 8765)")
+    parser.add_argument("--socket", metavar="PATH",
+                        help="listen on a Unix socket instead of a port")
+    parser.add_argument("--probs", metavar="FILE",
+                        help="JSON or YAML file of probabilities to use "
+                             "in place of PROBS")
+    parser.add_argument("--memory", type=float, default=256, metavar="MiB",
+                        help="memory for compiled pedigrees before the "
+                             "least recently used are evicted "
+                             "(default: 256)")
+    parser.add_argument("--load", action="append", default=[],
+                        metavar="ID=FILE",
+                        help="load a pedigree from a CSV file at startup; "
+                             "may be given more than once")
+    args = parser.parse_args()
+
+    try:
+        probs = load_probs(args.probs) if args.probs else PROBS
+    except (ImportError, OSError, ValueError) as e:
+        sys.exit(str(e))
+    service = InferenceService(probs, memory_limit=int(args.memory * 2**20))
+    for spec in args.load:
+        pedigree_id, sep, filename = spec.partition("=")
+        if not sep:
+            parser.error(f"--load expects ID=FILE, not {spec}")
+        service.load(pedigree_id, load_data(filename))
+
+    server = make_server(service, args.host, args.port, args.socket)
+    where = args.socket or f"http://{args.host}:{args.port}"
+    print(f"Serving on {where}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket:
+            os.unlink(args.socket)
+
+
+class UnknownPedigree(LookupError):
+    """
+    Raised for a pedigree id that is not loaded.
+    """
+
+
+class InferenceService:
+    """
+    Pedigrees loaded by id, each compiled into a `CliqueTree` and kept
+    in a least recently used cache bounded by an estimate of memory use.
+    Evicted pedigrees keep their people and observations and are
+    compiled again the next time they are used.
+    """
+
+    def __init__(self, probs=PROBS, memory_limit=256 * 2**20):
+        self.probs = probs
+        self.memory_limit = memory_limit
+        self.people = dict()
+        self.trees = collections.OrderedDict()
+        self.sizes = dict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def load(self, pedigree_id, people):
+        """
+        Compile `people`, a dictionary as returned by `load_data`, and
+        keep it under `pedigree_id`, replacing anything already there.
+        """
+        if not isinstance(people, dict):
+            raise ValueError("people must be an object")
+        for name, person in people.items():
+            if not isinstance(person, dict):
+                raise ValueError(f"{name} must be an object")
+            for parent in ("mother", "father"):
+                value = person.get(parent)
+                if value is not None and not isinstance(value, str):
+                    raise ValueError(
+                        f"{parent} for {name} must be a name or null"
+                    )
+            trait = person.get("trait")
+            if trait is not None and not isinstance(trait, bool):
+                raise ValueError(
+                    f"trait for {name} must be true, false or null"
+                )
+        people = {
+            name: {
+                "name": name,
+                "mother": person.get("mother"),
+                "father": person.get("father"),
+                "trait": person.get("trait")
+            }
+            for name, person in people.items()
+        }
+        tree = self.compile(people)
+        with self.lock:
+            self.unload(pedigree_id)
+            self.people[pedigree_id] = people
+            self.cache(pedigree_id, tree)
+        return {"id": pedigree_id, "people": len(people)}
+
+    def unload(self, pedigree_id):
+        """
+        Forget the pedigree kept under `pedigree_id`, if any.
+        """
+        self.people.pop(pedigree_id, None)
+        self.trees.pop(pedigree_id, None)
+        self.sizes.pop(pedigree_id, None)
+
+    def compile(self, people):
+        """
+        Return a calibrated clique tree for `people`, so that the first
+        query is answered from cache too.
+        """
+        tree = CliqueTree(people, self.probs)
+        tree.calibrate()
+        return tree
+
+    def cache(self, pedigree_id, tree):
+        """
+        Add `tree` as the most recently used entry, then evict the least
+        recently used others until the cache fits in the memory limit.
+        """
+        entries = sum(
+            len(factor.values) for factor in tree.potentials.values()
+        ) + sum(len(factor.values) for factor in tree.messages.values())
+        self.sizes[pedigree_id] = (
+            entries * ENTRY_BYTES + len(tree.pedigree) * PERSON_BYTES
+        )
+        self.trees[pedigree_id] = tree
+        while (len(self.trees) > 1 and
+               sum(self.sizes[i] for i in self.trees) > self.memory_limit):
+            self.trees.popitem(last=False)
+            self.evictions += 1
+
+    def tree(self, pedigree_id):
+        """
+        Return the clique tree for `pedigree_id`, compiling it again if
+        it has been evicted. Must be called holding the lock.
+        """
+        if pedigree_id not in self.people:
+            raise UnknownPedigree(pedigree_id)
+        if pedigree_id in self.trees:
+            self.hits += 1
+            self.trees.move_to_end(pedigree_id)
+            return self.trees[pedigree_id]
+        self.misses += 1
+        tree = self.compile(self.people[pedigree_id])
+        self.cache(pedigree_id, tree)
+        return tree
+
+    def posteriors(self, pedigree_id, names=None):
+        """
+        Return gene and trait distributions for the people in `names`
+        (default everyone) in the pedigree kept under `pedigree_id`.
+        """
+        with self.lock:
+            tree = self.tree(pedigree_id)
+            for name in names or ():
+                if name not in tree.pedigree:
+                    raise ValueError(f"{name} is not in the pedigree")
+            return tree.probabilities(names)
+
+    def observe(self, pedigree_id, observations):
+        """
+        Record `observations`, a dictionary from name to trait (True,
+        False or None to forget it), in the pedigree kept under
+        `pedigree_id`.
+        """
+        with self.lock:
+            tree = self.tree(pedigree_id)
+            people = self.people[pedigree_id]
+            for name, trait in observations.items():
+                if name not in people:
+                    raise ValueError(f"{name} is not in the pedigree")
+                if trait is not None and not isinstance(trait, bool):
+                    raise ValueError(
+                        f"trait for {name} must be true, false or null"
+                    )
+            for name, trait in observations.items():
+                tree.observe(name, trait)
+                people[name]["trait"] = trait
+        return {"id": pedigree_id, "observed": len(observations)}
+
+    def stats(self):
+        """
+        Return a summary of the pedigrees kept and the cache.
+        """
+        with self.lock:
+            return {
+                "pedigrees": sorted(self.people),
+                "compiled": list(self.trees),
+                "memory": sum(self.sizes[i] for i in self.trees),
+                "memory_limit": self.memory_limit,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    JSON over HTTP for an `InferenceService`:
+
+        GET    /pedigrees                     list pedigrees and cache stats
+        PUT    /pedigrees/ID                  load {"path": FILE} or
+                                              {"people": {...}}
+        GET    /pedigrees/ID?names=A,B        posterior distributions
+        POST   /pedigrees/ID/observations     record {"NAME": true, ...}
+        DELETE /pedigrees/ID                  forget a pedigree
+    """
+
+    service = None
+
+    def do_GET(self):
+        parts, query = self.route()
+        if parts == ["pedigrees"]:
+            return self.respond(200, self.service.stats())
+        if len(parts) == 2 and parts[0] == "pedigrees":
+            names = None
+            if "names" in query:
+                names = [
+                    name for value in query["names"]
+                    for name in value.split(",") if name
+                ]
+            started = time.perf_counter()
+            posteriors = self.service.posteriors(parts[1], names)
+            return self.respond(200, {
+                "id": parts[1],
+                "seconds": time.perf_counter() - started,
+                "posteriors": posteriors
+            })
+        self.respond(404, {"error": "not found"})
+
+    def do_PUT(self):
+        parts, _ = self.route()
+        if len(parts) != 2 or parts[0] != "pedigrees":
+            return self.respond(404, {"error": "not found"})
+        body = self.body()
+        if "path" in body:
+            try:
+                people = load_data(body["path"])
+            except KeyError as error:
+                raise ValueError(
+                    f"{body['path']} has no {error.args[0]} column"
+                )
+            except csv.Error as error:
+                raise ValueError(f"{body['path']}: {error}")
+        elif "people" in body:
+            people = body["people"]
+        else:
+            raise ValueError("expected a path or people")
+        self.respond(200, self.service.load(parts[1], people))
+
+    def do_POST(self):
+        parts, _ = self.route()
+        if (len(parts) != 3 or parts[0] != "pedigrees" or
+                parts[2] != "observations"):
+            return self.respond(404, {"error": "not found"})
+        self.respond(200, self.service.observe(parts[1], self.body()))
+
+    def do_DELETE(self):
+        parts, _ = self.route()
+        if len(parts) != 2 or parts[0] != "pedigrees":
+            return self.respond(404, {"error": "not found"})
+        with self.service.lock:
+            if parts[1] not in self.service.people:
+                raise UnknownPedigree(parts[1])
+            self.service.unload(parts[1])
+        self.respond(200, {"id": parts[1]})
+
+    def handle_one_request(self):
+        # Turn errors from any handler into JSON error responses
+        try:
+            super().handle_one_request()
+        except UnknownPedigree as error:
+            self.respond(404, {"error": f"no pedigree {error.args[0]}"})
+        except (ValueError, OSError) as error:
+            self.respond(400, {"error": str(error)})
+
+    def route(self):
+        """
+        Return the request path split into parts, and its query string.
+        """
+        url = urlsplit(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        return parts, parse_qs(url.query)
+
+    def body(self):
+        """
+        Return the request body parsed as a JSON object.
+        """
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError as error:
+            raise ValueError(f"invalid JSON: {error}")
+        if not isinstance(body, dict):
+            raise ValueError("expected a JSON object")
+        return body
+
+    def respond(self, status, payload):
+        """
+        Send `payload` as a JSON response with the given `status`.
+        """
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else "local"
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn,
+                     socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(service, host="127.0.0.1", port=8765, socket_path=None):
+    """
+    Return an HTTP server for `service`, listening on `host` and `port`
+    or, if given, on a Unix socket at `socket_path`.
+    """
+    handler = type("Handler", (Handler,), {"service": service})
+    if socket_path:
+        return UnixHTTPServer(socket_path, handler)
+    return ThreadingHTTPServer((host, port), handler)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import csv
+import json
+import math
+import sys
+
+from heredity import (
+    PROBS, load_data, load_probs, load_sweep, sweep_probabilities
+)
+
+# Columns written in CSV output, one row per person per parameter set
+CSV_FIELDS = [
+    "set", "person",
+    "gene_2", "gene_1", "gene_0",
+    "trait_true", "trait_false"
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        usage="python sweep.py [options] data.csv SWEEP",
+        description="Compute everyone's distributions under many sets of "
+                    "probabilities at once. SWEEP is a JSON or YAML file "
+                    "holding a list of probabilities in the form of "
+                    "PROBS, each giving only the keys that differ from "
+                    "the base probabilities."
+    )
+    parser.add_argument("data")
+    parser.add_argument("sweep")
+    parser.add_argument("--probs", metavar="FILE",
+                        help="JSON or YAML file of base probabilities to "
+                             "use in place of PROBS")
+    parser.add_argument("--format", choices=("csv", "jsonl"),
+                        default="csv",
+                        help="output format (default: csv)")
+    parser.add_argument("--output", metavar="FILE",
+                        help="file to write results to (default: stdout)")
+    args = parser.parse_args()
+
+    try:
+        base = load_probs(args.probs) if args.probs else PROBS
+        sweep = load_sweep(args.sweep, base)
+    except (ImportError, OSError, ValueError) as e:
+        sys.exit(str(e))
+    results = sweep_probabilities(load_data(args.data), sweep)
+    for index, probabilities in enumerate(results):
+        if any(math.isnan(distribution[value])
+               for person in probabilities.values()
+               for distribution in person.values()
+               for value in distribution):
+            print(f"Set {index} makes the known traits impossible",
+                  file=sys.stderr)
+
+    output = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        if args.format == "csv":
+            write_csv(output, results)
+        else:
+            write_jsonl(output, results)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+def write_csv(output, results):
+    """
+    Write every parameter set's `probabilities` in `results` to `output`
+    as CSV rows, one per person per set, numbering sets from 0.
+    """
+    writer = csv.writer(output)
+    writer.writerow(CSV_FIELDS)
+    for index, probabilities in enumerate(results):
+        for person in probabilities:
+            gene = probabilities[person]["gene"]
+            trait = probabilities[person]["trait"]
+            writer.writerow([
+                index, person,
+                gene[2], gene[1], gene[0],
+                trait[True], trait[False]
+            ])
+
+
+def write_jsonl(output, results):
+    """
+    Write every parameter set's `probabilities` in `results` to `output`
+    as JSON lines, one object per person per set, numbering sets from 0.
+    """
+    for index, probabilities in enumerate(results):
+        for person in probabilities:
+            output.write(json.dumps({
+                "set": index,
+                "person": person,
+                **probabilities[person]
+            }) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+import heredity
+from batch import find_csvs, read_families
+from tests.test_engines import assert_close
+
+
+def test_read_families_groups_rows(tmp_path):
+    path = tmp_path / "cohort.csv"
+    path.write_text(
+        "family_id,name,mother,father,trait\n"
+        "a,Lily,,,0\n"
+        "a,Harry,Lily,James,\n"
+        "a,James,,,1\n"
+        "b,Ron,,,\n"
+    )
+    (tmp_path / "single.csv").write_text(
+        "name,mother,father,trait\nArthur,,,0\n"
+    )
+    families = list(read_families(find_csvs([str(tmp_path)])))
+    assert [family for family, _ in families] == ["a", "b", "single"]
+    assert sorted(families[0][1]) == ["Harry", "James", "Lily"]
+    assert families[0][1]["Harry"] == {
+        "name": "Harry", "mother": "Lily", "father": "James", "trait": None
+    }
+    assert families[2][1]["Arthur"]["trait"] is False
+
+
+def test_read_families_rejects_split_families(tmp_path):
+    path = tmp_path / "cohort.csv"
+    path.write_text(
+        "family_id,name,mother,father,trait\n"
+        "a,Lily,,,0\n"
+        "b,Ron,,,\n"
+        "a,James,,,1\n"
+    )
+    with pytest.raises(ValueError, match="not contiguous"):
+        list(read_families([str(path)]))
+
+
+def test_bad_family_is_reported_and_skipped(tmp_path):
+    path = tmp_path / "cohort.csv"
+    path.write_text(
+        "family_id,name,mother,father,trait\n"
+        "a,Harry,Lily,James,\n"
+        "b,Lily,,,0\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "batch.py", str(path), "data/family0.csv"],
+        capture_output=True, text=True
+    )
+    assert result.returncode == 1
+    records = [json.loads(line) for line in result.stdout.splitlines()]
+    assert records[0] == {
+        "family": "a", "error": "Harry's mother Lily is not listed"
+    }
+    assert [record["family"] for record in records[1:]] == \
+        ["b"] + ["family0"] * 3
+
+    expected = heredity.infer(heredity.load_data("data/family0.csv"))
+    actual = {
+        record["person"]: {
+            field: {
+                json.loads(value): p
+                for value, p in record[field].items()
+            }
+            for field in ("gene", "trait")
+        }
+        for record in records[2:]
+    }
+    assert_close(actual, expected)
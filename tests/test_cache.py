@@ -0,0 +1,80 @@
+import itertools
+import types
+
+import pytest
+
+import heredity
+from heredity import ResultCache, infer, infer_families, load_data
+from tests.test_engines import assert_close, random_people, random_probs
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    Give the cache a clock that ticks once per reading, so that times
+    of use are never tied.
+    """
+    ticks = itertools.count()
+    monkeypatch.setattr(heredity, "time",
+                        types.SimpleNamespace(time=lambda: next(ticks)))
+
+
+def person(name):
+    return {name: {"name": name, "mother": None, "father": None,
+                   "trait": None}}
+
+
+def test_get_and_put(tmp_path):
+    path = str(tmp_path / "cache.db")
+    people = load_data("data/family0.csv")
+    probabilities = infer(people)
+    with ResultCache(path) as cache:
+        key = cache.key(people)
+        assert cache.get(key) is None
+        cache.put(key, probabilities)
+        assert_close(cache.get(key), probabilities, tolerance=0)
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    # Results outlive the cache, but only for the same probabilities
+    with ResultCache(path) as cache:
+        assert_close(cache.get(cache.key(people)), probabilities, tolerance=0)
+    with ResultCache(path, random_probs(0)) as cache:
+        assert cache.get(cache.key(people)) is None
+
+
+def test_key_ignores_order_but_not_traits(tmp_path):
+    people = load_data("data/family0.csv")
+    with ResultCache(str(tmp_path / "cache.db")) as cache:
+        reordered = {name: dict(people[name]) for name in reversed(people)}
+        assert cache.key(reordered) == cache.key(people)
+        people["Harry"]["trait"] = True
+        assert cache.key(people)[0] != cache.key(reordered)[0]
+
+
+@pytest.mark.parametrize("commit_every", [1, 1000])
+def test_least_recently_used_are_deleted(tmp_path, clock, commit_every):
+    # Each person's results take 40 bytes, so two fit
+    path = str(tmp_path / "cache.db")
+    with ResultCache(path, max_bytes=80, commit_every=commit_every) as cache:
+        for name in ("A", "B"):
+            cache.put(cache.key(person(name)), infer(person(name)))
+        assert cache.get(cache.key(person("A"))) is not None
+        cache.put(cache.key(person("C")), infer(person("C")))
+
+    with ResultCache(path, max_bytes=80) as cache:
+        assert cache.size == 80
+        assert cache.get(cache.key(person("A"))) is not None
+        assert cache.get(cache.key(person("B"))) is None
+        assert cache.get(cache.key(person("C"))) is not None
+
+
+def test_infer_families_with_cache(tmp_path):
+    people = random_people(3, size=8)
+    with ResultCache(str(tmp_path / "cache.db")) as cache:
+        expected = infer_families(people, cache=cache)
+        assert cache.hits == 0 and cache.misses > 0
+        misses = cache.misses
+        assert_close(infer_families(people, cache=cache), expected,
+                     tolerance=0)
+        assert (cache.hits, cache.misses) == (misses, misses)
+    assert_close(expected, infer(people))
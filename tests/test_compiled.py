@@ -0,0 +1,114 @@
+import os
+import shutil
+
+import pytest
+
+import heredity
+from heredity import load_data, load_pedigree, map_npz, write_npz
+from tests.test_engines import assert_close, needs_numpy
+
+pytestmark = needs_numpy
+
+
+def columns(pedigree):
+    """
+    Return a pedigree's names, parents and traits as lists.
+    """
+    return (list(pedigree.names), list(pedigree.mothers),
+            list(pedigree.fathers), list(pedigree.traits))
+
+
+def test_write_npz_aligns_arrays(tmp_path):
+    np = heredity.np
+    path = str(tmp_path / "arrays.npz")
+    arrays = {
+        "bytes": np.arange(7, dtype=np.uint8),
+        "ints": np.arange(1000, dtype=np.int64),
+        "empty": np.array([], dtype=np.int8),
+        "grid": np.arange(12, dtype=np.int32).reshape(3, 4)
+    }
+    write_npz(path, arrays)
+
+    mapped = map_npz(path)
+    with np.load(path) as loaded:
+        for name, values in arrays.items():
+            assert np.array_equal(mapped[name], values)
+            assert np.array_equal(loaded[name], values)
+            assert mapped[name].ctypes.data % 64 == 0
+            assert not mapped[name].flags.writeable
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "family.csv"
+    shutil.copy("data/family2.csv", path)
+    return str(path)
+
+
+@pytest.fixture
+def digests(monkeypatch):
+    """
+    Count the files hashed by `file_digest`.
+    """
+    hashed = []
+    file_digest = heredity.file_digest
+
+    def counting(filename):
+        hashed.append(filename)
+        return file_digest(filename)
+    monkeypatch.setattr(heredity, "file_digest", counting)
+    return hashed
+
+
+def test_load_pedigree_reuses_compiled_file(source, digests):
+    pedigree = load_pedigree(source, cache=True)
+    assert os.path.exists(source + ".npz")
+    assert columns(pedigree) == columns(load_pedigree(source))
+
+    reopened = load_pedigree(source, cache=True)
+    assert isinstance(reopened.mothers, memoryview)
+    assert columns(reopened) == columns(pedigree)
+    assert_close(heredity.infer(reopened), heredity.infer(load_data(source)))
+
+    # Hashed once when saved, and not again while the source is unchanged
+    assert digests == [source]
+
+
+def test_touched_source_is_hashed_once(source, digests):
+    load_pedigree(source, cache=True)
+    stat = os.stat(source)
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    digests.clear()
+    load_pedigree(source, cache=True)
+    assert digests == [source]
+    load_pedigree(source, cache=True)
+    assert digests == [source]
+
+
+def test_edited_source_is_read_again(source):
+    load_pedigree(source, cache=True)
+    stat = os.stat(source)
+    with open(source) as f:
+        text = f.read()
+    with open(source, "w") as f:
+        f.write(text.replace("Arthur,,,0", "Arthur,,,1"))
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert os.stat(source).st_size == stat.st_size
+
+    pedigree = load_pedigree(source, cache=True)
+    assert_close(heredity.infer(pedigree), heredity.infer(load_data(source)))
+    assert pedigree.traits[pedigree.ids["Arthur"]] == 1
+
+
+def test_read_pedigree_csv_skips_blank_rows(tmp_path):
+    path = tmp_path / "people.csv"
+    path.write_text(
+        "name,mother,father,trait\n"
+        "Lily,,,0\n"
+        "\n"
+        "James,,,1\n"
+        "Harry,Lily,James\n"
+    )
+    assert columns(heredity.read_pedigree_csv(str(path))) == \
+        columns(load_pedigree(str(path)))
@@ -0,0 +1,282 @@
+import functools
+import math
+import random
+
+import pytest
+
+import heredity
+from heredity import (
+    GENES, PROBS, CliqueTree, joint_probability, load_data, parse_probs,
+    powerset
+)
+
+# Every engine that should agree exactly with brute force
+ENGINES = {
+    "exact": heredity.infer,
+    "enumerate": heredity.enumerate_probabilities,
+    "pruned": functools.partial(heredity.enumerate_probabilities, prune=True),
+    "gray": heredity.gray_code_probabilities,
+    "vectorized": heredity.vectorized_probabilities,
+    "families": heredity.infer_families,
+}
+
+needs_numpy = pytest.mark.skipif(heredity.np is None,
+                                 reason="NumPy is not installed")
+
+SEEDS = range(20)
+
+DATA = ["data/family0.csv", "data/family1.csv", "data/family2.csv"]
+
+
+def random_people(seed, size=6):
+    """
+    Return a random pedigree of up to `size` people, in the form of
+    `load_data`. Children may have related parents, or one person as
+    both parents, and some traits are known.
+    """
+    rng = random.Random(seed)
+    people = dict()
+    for i in range(rng.randint(2, size)):
+        mother = father = None
+        if len(people) >= 2 and rng.random() < 0.6:
+            mother, father = rng.sample(sorted(people), 2)
+            if rng.random() < 0.2:
+                father = mother
+        people[f"P{i}"] = {
+            "name": f"P{i}",
+            "mother": mother,
+            "father": father,
+            "trait": rng.choice([None, None, True, False])
+        }
+    return people
+
+
+def random_probs(seed):
+    """
+    Return random probabilities in the form of PROBS.
+    """
+    rng = random.Random(seed)
+    gene = [rng.random() + 0.01 for _ in GENES]
+    trait = [rng.uniform(0.01, 0.99) for _ in GENES]
+    return parse_probs({
+        "gene": {genes: gene[genes] / sum(gene) for genes in GENES},
+        "trait": {
+            genes: {True: trait[genes], False: 1 - trait[genes]}
+            for genes in GENES
+        },
+        "mutation": rng.uniform(0, 0.2)
+    })
+
+
+def assignments(people):
+    """
+    Generate every (one_gene, two_genes, have_trait) assignment that
+    agrees with the known traits in `people`.
+    """
+    names = set(people)
+    known = {person for person in people if people[person]["trait"]}
+    unknown = {person for person in people
+               if people[person]["trait"] is None}
+    for one_gene in powerset(names):
+        for two_genes in powerset(names - one_gene):
+            for have_trait in powerset(unknown):
+                yield one_gene, two_genes, have_trait | known
+
+
+def brute_force(people, probs=PROBS):
+    """
+    Return everyone's gene and trait distributions, and the total
+    probability of the known traits, by summing `joint_probability` over
+    every assignment.
+    """
+    probabilities = {
+        person: {"gene": {genes: 0 for genes in GENES},
+                 "trait": {True: 0, False: 0}}
+        for person in people
+    }
+    total = 0
+    for one_gene, two_genes, have_trait in assignments(people):
+        p = joint_probability(people, one_gene, two_genes, have_trait, probs)
+        total += p
+        for person in people:
+            genes = (1 if person in one_gene else
+                     2 if person in two_genes else 0)
+            probabilities[person]["gene"][genes] += p
+            probabilities[person]["trait"][person in have_trait] += p
+    for person in people:
+        for distribution in probabilities[person].values():
+            for value in distribution:
+                distribution[value] /= total
+    return probabilities, total
+
+
+def assert_close(actual, expected, tolerance=1e-9):
+    assert actual.keys() == expected.keys()
+    for person in expected:
+        for field in ("gene", "trait"):
+            for value, p in expected[person][field].items():
+                assert actual[person][field][value] == pytest.approx(
+                    p, abs=tolerance
+                ), (person, field, value)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("seed", SEEDS)
+def test_engines_match_brute_force(engine, seed):
+    if engine == "vectorized" and heredity.np is None:
+        pytest.skip("NumPy is not installed")
+    people = random_people(seed)
+    expected, _ = brute_force(people)
+    assert_close(ENGINES[engine](people), expected)
+
+
+# Someone whose mother and father are the same person
+SELFED = {
+    "A": {"name": "A", "mother": None, "father": None, "trait": True},
+    "B": {"name": "B", "mother": "A", "father": "A", "trait": None}
+}
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_engines_with_one_person_as_both_parents(engine):
+    if engine == "vectorized" and heredity.np is None:
+        pytest.skip("NumPy is not installed")
+    expected, _ = brute_force(SELFED)
+    assert expected["A"]["gene"][2] == pytest.approx(0.1976, abs=1e-4)
+    assert_close(ENGINES[engine](SELFED), expected)
+
+
+@pytest.mark.parametrize("filename", DATA)
+def test_exact_matches_brute_force_on_data(filename):
+    people = load_data(filename)
+    expected, _ = brute_force(people)
+    assert_close(heredity.infer(people), expected)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_exact_with_other_probabilities(seed):
+    people = random_people(seed)
+    probs = random_probs(seed)
+    expected, _ = brute_force(people, probs)
+    assert_close(heredity.infer(people, probs), expected)
+
+
+@needs_numpy
+def test_gibbs_is_close():
+    people = load_data("data/family2.csv")
+    expected, _ = brute_force(people)
+    probabilities = heredity.sample_probabilities(
+        people, samples=200000, seed=0
+    )
+    assert_close(probabilities, expected, tolerance=0.02)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_log_likelihood(seed):
+    people = random_people(seed)
+    probs = random_probs(seed)
+    _, total = brute_force(people, probs)
+    tree = CliqueTree(people, probs)
+    tree.calibrate()
+    assert tree.log_likelihood == pytest.approx(math.log(total))
+
+
+@pytest.mark.parametrize("seed", list(SEEDS) + ["selfed"])
+def test_top_configurations(seed):
+    people = SELFED if seed == "selfed" else random_people(seed)
+    expected = sorted(
+        (joint_probability(people, *assignment)
+         for assignment in assignments(people)),
+        reverse=True
+    )
+    k = 5
+    configurations = heredity.top_configurations(people, k)
+    assert len(configurations) == min(k, len(expected))
+    for (assignment, log_probability), p in zip(configurations, expected):
+        assert math.exp(log_probability) == pytest.approx(p, rel=1e-9)
+        assert joint_probability(people, *assignment) == pytest.approx(
+            p, rel=1e-9
+        )
+
+
+@needs_numpy
+@pytest.mark.parametrize("seed", SEEDS)
+def test_sweep_probabilities(seed):
+    people = random_people(seed)
+    sweep = [PROBS] + [random_probs(seed * 10 + i) for i in range(3)]
+    results = heredity.sweep_probabilities(people, sweep)
+    assert len(results) == len(sweep)
+    for probs, probabilities in zip(sweep, results):
+        assert_close(probabilities, brute_force(people, probs)[0])
+
+
+@needs_numpy
+def test_sweep_marks_impossible_sets():
+    people = load_data("data/family0.csv")
+    impossible = parse_probs({
+        "gene": PROBS["gene"],
+        "trait": {genes: {True: 0, False: 1} for genes in GENES},
+        "mutation": PROBS["mutation"]
+    })
+    _, results = heredity.sweep_probabilities(people, [PROBS, impossible])
+    assert all(math.isnan(p) for p in results["Harry"]["gene"].values())
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_infer_query_matches_infer(seed):
+    rng = random.Random(seed)
+    people = random_people(seed, size=10)
+    query = rng.sample(sorted(people), rng.randint(1, min(3, len(people))))
+    probabilities = heredity.infer_query(people, query)
+    assert list(probabilities) == query
+    expected = heredity.infer(people)
+    assert_close(probabilities, {person: expected[person] for person in query})
+
+
+def test_query_pedigree_prunes_barren_people():
+    people = load_data("data/family0.csv")
+
+    # Harry's trait is unknown and he has no children, so he can't tell
+    # us anything about his parents
+    people["Harry"]["trait"] = None
+    assert sorted(heredity.query_pedigree(people, ["Lily"])) == ["Lily"]
+    assert sorted(heredity.query_pedigree(people, ["Harry"])) == \
+        ["Harry", "James", "Lily"]
+    with pytest.raises(ValueError):
+        heredity.query_pedigree(people, ["Voldemort"])
+
+
+@pytest.mark.parametrize("n", range(9))
+@pytest.mark.parametrize("count", [1, 3, 8, 16])
+def test_one_gene_shards_cover_every_mask(n, count):
+    shards = heredity.one_gene_shards(n, count)
+    assert len(shards) <= count
+    assert [mask for shard in shards for mask in shard] == list(range(1 << n))
+
+
+@pytest.mark.parametrize("prune", [False, True])
+@pytest.mark.parametrize("seed", range(5))
+def test_enumerate_with_workers(seed, prune):
+    people = random_people(seed, size=7)
+    expected, _ = brute_force(people)
+    assert_close(
+        heredity.enumerate_probabilities(people, workers=2, prune=prune),
+        expected
+    )
+
+
+def test_infer_families_with_workers():
+    # The sample families, with names made distinct
+    people = dict()
+    for i, filename in enumerate(DATA):
+        def rename(name):
+            return name and f"{name}{i}"
+        for name, person in load_data(filename).items():
+            people[rename(name)] = {
+                "name": rename(name),
+                "mother": rename(person["mother"]),
+                "father": rename(person["father"]),
+                "trait": person["trait"]
+            }
+    assert_close(heredity.infer_families(people, workers=2),
+                 heredity.infer(people))
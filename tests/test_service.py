@@ -0,0 +1,111 @@
+import copy
+import json
+import random
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import heredity
+from service import InferenceService, make_server
+from tests.test_engines import SEEDS, assert_close, random_people
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_observe_matches_fresh_inference(seed):
+    rng = random.Random(seed)
+    people = random_people(seed)
+    tree = heredity.CliqueTree(people)
+    tree.calibrate()
+    observed = copy.deepcopy(people)
+    for _ in range(5):
+        name = rng.choice(sorted(people))
+        observed[name]["trait"] = rng.choice([None, True, False])
+        tree.observe(name, observed[name]["trait"])
+        assert_close(tree.probabilities(), heredity.infer(observed))
+
+    # The people passed in are never changed
+    assert people == random_people(seed)
+
+
+@pytest.fixture
+def server():
+    server = make_server(InferenceService(), port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def request(url, method="GET", body=None):
+    """
+    Send a JSON request and return the status and decoded response.
+    """
+    data = None if body is None else json.dumps(body).encode()
+    try:
+        with urllib.request.urlopen(
+            urllib.request.Request(url, data=data, method=method)
+        ) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as error:
+        return error.code, json.loads(error.read())
+
+
+def test_handler(server):
+    pedigree = f"{server}/pedigrees/family"
+    status, body = request(pedigree, "PUT", {"path": "data/family0.csv"})
+    assert (status, body["people"]) == (200, 3)
+
+    status, body = request(f"{pedigree}?names=Harry")
+    assert status == 200 and list(body["posteriors"]) == ["Harry"]
+    expected = heredity.infer(heredity.load_data("data/family0.csv"))
+    assert body["posteriors"]["Harry"]["gene"]["2"] == pytest.approx(
+        expected["Harry"]["gene"][2]
+    )
+
+    status, _ = request(f"{pedigree}/observations", "POST", {"Harry": True})
+    assert status == 200
+    people = heredity.load_data("data/family0.csv")
+    people["Harry"]["trait"] = True
+    _, body = request(pedigree)
+    assert body["posteriors"]["Lily"]["gene"]["1"] == pytest.approx(
+        heredity.infer(people)["Lily"]["gene"][1]
+    )
+
+    assert request(pedigree, "DELETE")[0] == 200
+    assert request(pedigree)[0] == 404
+    assert request(pedigree, "DELETE")[0] == 404
+
+
+@pytest.mark.parametrize("body", [
+    {"people": [1, 2]},
+    {"people": {"A": 5}},
+    {"people": {"A": {"trait": 1}}},
+    {"people": {"A": {"mother": "B", "father": "B"}}},
+    {"path": "heredity.py"},
+    {"path": "no/such/file.csv"},
+    {}
+])
+def test_handler_rejects_bad_pedigrees(server, body):
+    status, response = request(f"{server}/pedigrees/bad", "PUT", body)
+    assert status == 400 and "error" in response
+
+
+def test_handler_rejects_csv_without_names(server, tmp_path):
+    path = tmp_path / "people.csv"
+    path.write_text("mother,father,trait\n,,1\n")
+    status, response = request(f"{server}/pedigrees/bad", "PUT",
+                               {"path": str(path)})
+    assert (status, response) == (400, {"error": f"{path} has no name column"})
+
+
+def test_handler_accepts_one_person_as_both_parents(server):
+    people = {
+        "A": {"mother": None, "father": None, "trait": True},
+        "B": {"mother": "A", "father": "A", "trait": None}
+    }
+    status, _ = request(f"{server}/pedigrees/selfed", "PUT",
+                        {"people": people})
+    assert status == 200
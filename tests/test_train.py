@@ -0,0 +1,69 @@
+import itertools
+import math
+
+import pytest
+
+from heredity import GENES, PROBS, joint_probability
+from tests.test_engines import (
+    SEEDS, assignments, brute_force, random_people, random_probs
+)
+from train import family_statistics, fit, maximize
+
+
+def expected_statistics(people, probs):
+    """
+    Return the statistics `family_statistics` should give for `people`,
+    by weighting every assignment by its posterior probability.
+    """
+    _, total = brute_force(people, probs)
+    founders = [0.0] * len(GENES)
+    traits = [[0.0, 0.0] for _ in GENES]
+    for one_gene, two_genes, have_trait in assignments(people):
+        p = joint_probability(people, one_gene, two_genes, have_trait,
+                              probs) / total
+        for person in people:
+            genes = (1 if person in one_gene else
+                     2 if person in two_genes else 0)
+            if people[person]["mother"] is None:
+                founders[genes] += p
+            if people[person]["trait"] is not None:
+                traits[genes][people[person]["trait"]] += p
+    return founders, traits, math.log(total)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_family_statistics_match_brute_force(seed):
+    people = random_people(seed)
+    probs = random_probs(seed)
+    founders, traits, log_likelihood = expected_statistics(people, probs)
+    statistics = family_statistics([people], probs)
+    assert statistics["founders"] == pytest.approx(founders)
+    for genes in GENES:
+        assert statistics["traits"][genes] == pytest.approx(traits[genes])
+    assert statistics["log_likelihood"] == pytest.approx(log_likelihood)
+
+
+def test_maximize():
+    statistics = {
+        "founders": [6.0, 3.0, 1.0],
+        "traits": [[4.0, 0.0], [1.0, 3.0], [0.0, 0.0]],
+        "log_likelihood": -1.0,
+        "families": 2
+    }
+    probs = maximize(statistics, PROBS)
+    assert probs["gene"] == pytest.approx({0: 0.6, 1: 0.3, 2: 0.1})
+    assert probs["trait"][0] == pytest.approx({True: 0.0, False: 1.0})
+    assert probs["trait"][1] == pytest.approx({True: 0.75, False: 0.25})
+
+    # With no data, the old probabilities and mutation rate are kept
+    assert probs["trait"][2] == PROBS["trait"][2]
+    assert probs["mutation"] == PROBS["mutation"]
+
+
+def test_fit_never_lowers_the_likelihood():
+    likelihoods = [
+        log_likelihood for _, log_likelihood, _, _ in
+        itertools.islice(fit(["data"]), 10)
+    ]
+    assert all(a <= b + 1e-9 for a, b in zip(likelihoods, likelihoods[1:]))
+    assert likelihoods[-1] > likelihoods[0]
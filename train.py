@@ -0,0 +1,242 @@
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from batch import find_csvs, read_families
+from heredity import (
+    GENES, PROBS, CliqueTree, load_probs, parse_probs, split_families
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        usage="python train.py [options] PATH [PATH ...]",
+        description="Fit gene priors and trait probabilities to families "
+                    "with known traits by expectation maximization, and "
+                    "write them out in a form --probs can load. Each PATH "
+                    "is as for batch.py."
+    )
+    parser.add_argument("paths", nargs="+", metavar="PATH")
+    parser.add_argument("--probs", metavar="FILE",
+                        help="JSON or YAML file of probabilities to start "
+                             "from in place of PROBS; the mutation rate is "
+                             "kept fixed")
+    parser.add_argument("--output", metavar="FILE",
+                        help="JSON file to write fitted probabilities to "
+                             "(default: stdout)")
+    parser.add_argument("--workers", type=int, default=1, metavar="N",
+                        help="processes to spread families across")
+    parser.add_argument("--iterations", type=int, default=100, metavar="N",
+                        help="most iterations to run (default: 100)")
+    parser.add_argument("--tolerance", type=float, default=1e-6,
+                        help="stop once no probability changes by more "
+                             "than this (default: 1e-6)")
+    parser.add_argument("--chunk-size", type=int, default=64, metavar="N",
+                        help="families to send to a worker at a time "
+                             "(default: 64)")
+    args = parser.parse_args()
+    if args.workers < 1 or args.chunk_size < 1 or args.iterations < 1:
+        parser.error("--workers, --chunk-size and --iterations must be "
+                     "at least 1")
+
+    try:
+        probs = load_probs(args.probs) if args.probs else PROBS
+    except (ImportError, OSError, ValueError) as e:
+        sys.exit(str(e))
+    for iteration, (fitted, log_likelihood, families, seconds) in enumerate(
+        fit(args.paths, probs, args.workers, args.chunk_size), 1
+    ):
+        change = max_change(probs, fitted)
+        print(f"Iteration {iteration}: log likelihood {log_likelihood:.6f} "
+              f"over {families} families, largest change {change:.3g}, "
+              f"{seconds:.2f}s", file=sys.stderr)
+        probs = fitted
+        if change <= args.tolerance or iteration == args.iterations:
+            break
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        json.dump(probs_to_json(probs), output, indent=4)
+        output.write("\n")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+def fit(paths, probs=PROBS, workers=1, chunk_size=64):
+    """
+    Lazily generate successive expectation maximization estimates from
+    the families in the CSV files at `paths`, starting from `probs`, as
+    (probs, log likelihood, families, seconds) tuples. The log likelihood
+    is that of the known traits under the probabilities the estimate was
+    made from.
+
+    Families are read afresh and sent to `workers` processes in chunks of
+    `chunk_size` on every iteration, and their statistics added up as
+    they come back, so the whole cohort is never held in memory.
+    """
+    executor = ProcessPoolExecutor(workers) if workers > 1 else None
+    try:
+        while True:
+            start = time.perf_counter()
+            statistics = empty_statistics()
+            for chunk_statistics in map_chunks(
+                executor, workers, chunks(paths, chunk_size), probs
+            ):
+                add_statistics(statistics, chunk_statistics)
+            probs = maximize(statistics, probs)
+            yield (probs, statistics["log_likelihood"],
+                   statistics["families"], time.perf_counter() - start)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def chunks(paths, size):
+    """
+    Lazily generate lists of up to `size` families from the CSV files at
+    `paths`, each a dictionary as returned by `load_data`.
+    """
+    chunk = []
+    for _, people in read_families(find_csvs(paths)):
+        chunk.append(people)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def map_chunks(executor, workers, chunks, probs):
+    """
+    Lazily generate `family_statistics` for every chunk in `chunks`, in
+    no particular order, keeping at most two chunks per worker in flight
+    if there is an `executor`.
+    """
+    if executor is None:
+        for chunk in chunks:
+            yield family_statistics(chunk, probs)
+        return
+
+    pending = set()
+    for chunk in chunks:
+        pending.add(executor.submit(family_statistics, chunk, probs))
+        if len(pending) >= 2 * workers:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    for future in pending:
+        yield future.result()
+
+
+def empty_statistics():
+    """
+    Return zeroed sufficient statistics: expected gene counts among
+    founders, expected counts of each gene count with each known trait,
+    the total log likelihood and the number of families.
+    """
+    return {
+        "founders": [0.0] * len(GENES),
+        "traits": [[0.0, 0.0] for _ in GENES],
+        "log_likelihood": 0.0,
+        "families": 0
+    }
+
+
+def add_statistics(total, statistics):
+    """
+    Add `statistics` into `total` in place.
+    """
+    for genes in GENES:
+        total["founders"][genes] += statistics["founders"][genes]
+        for trait in (0, 1):
+            total["traits"][genes][trait] += statistics["traits"][genes][trait]
+    total["log_likelihood"] += statistics["log_likelihood"]
+    total["families"] += statistics["families"]
+
+
+def family_statistics(chunk, probs):
+    """
+    Return the sufficient statistics of the families in `chunk` under
+    `probs`, from everyone's gene distribution given the known traits.
+    """
+    statistics = empty_statistics()
+    for people in chunk:
+        for pedigree in split_families(people):
+            tree = CliqueTree(pedigree, probs)
+            tree.calibrate()
+            statistics["log_likelihood"] += tree.log_likelihood
+            statistics["families"] += 1
+            for person in range(len(pedigree)):
+                trait = pedigree.traits[person]
+                if not pedigree.is_founder(person) and trait < 0:
+                    continue
+                gene = tree.gene_distribution(person)
+                for genes in GENES:
+                    if pedigree.is_founder(person):
+                        statistics["founders"][genes] += gene[genes]
+                    if trait >= 0:
+                        statistics["traits"][genes][trait] += gene[genes]
+    return statistics
+
+
+def maximize(statistics, probs):
+    """
+    Return new probabilities from `statistics`: gene priors and trait
+    probabilities in proportion to their expected counts. The mutation
+    rate is kept from `probs`, as is any distribution with no data.
+    """
+    founders = sum(statistics["founders"])
+    gene = {
+        genes: statistics["founders"][genes] / founders if founders
+        else probs["gene"][genes]
+        for genes in GENES
+    }
+    trait = dict()
+    for genes in GENES:
+        counts = statistics["traits"][genes]
+        total = sum(counts)
+        trait[genes] = {
+            value: counts[value] / total if total
+            else probs["trait"][genes][value]
+            for value in (True, False)
+        }
+    return parse_probs({
+        "gene": gene, "trait": trait, "mutation": probs["mutation"]
+    })
+
+
+def max_change(old, new):
+    """
+    Return the largest difference between any probability in `old` and
+    `new`.
+    """
+    changes = [abs(old["gene"][genes] - new["gene"][genes])
+               for genes in GENES]
+    changes += [abs(old["trait"][genes][value] - new["trait"][genes][value])
+                for genes in GENES for value in (True, False)]
+    return max(changes)
+
+
+def probs_to_json(probs):
+    """
+    Return `probs` with string keys, as `load_probs` reads from JSON.
+    """
+    return {
+        "gene": {str(genes): probs["gene"][genes]
+                 for genes in sorted(GENES, reverse=True)},
+        "trait": {
+            str(genes): {
+                "true": probs["trait"][genes][True],
+                "false": probs["trait"][genes][False]
+            }
+            for genes in sorted(GENES, reverse=True)
+        },
+        "mutation": probs["mutation"]
+    }
+
+
+if __name__ == "__main__":
+    main()